@@ -1,10 +1,15 @@
+import sys
+from os.path import dirname, abspath, join
 from commands import load_data
-import mainout
+
+sys.path.append(join(dirname(abspath(__file__)), 'src')) # shared modules live in src
+import bulk
+import configuration
 
 def generate_singles_from_file(path = 'URLs.json'): 
     data = load_data(path)
-    for name, url in data.items():
-        mainout.from_url_to_html_file(file_name=name,url=url)
+    return bulk.generate_singles(data)
         
 if __name__ == '__main__':
+    configuration.setup_logging()
     generate_singles_from_file()
\ No newline at end of file
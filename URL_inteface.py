@@ -1,8 +1,9 @@
 import re
 import commands
+import configuration
 
 default_path = 'URLs.json'
-save_point, data_path, staged_data = commands.set_data_path(default_path,None)
+save_point, data_path, staged_data = None, None, None # read by main_loop, importing this module reads no data
 
 def execute_command(command:re.Match):
     command = command.groupdict() # this allows manipulability for the command components
@@ -12,6 +13,8 @@ def execute_command(command:re.Match):
         commands.commands[function_to_exec](argument, staged_data) # this line executes the command
 
 def main_loop():
+    global save_point, data_path, staged_data
+    save_point, data_path, staged_data = commands.set_data_path(default_path,None)
     input_line = input()
     while input_line != r'\exit':
         if command := re.match(commands.command_syntax, input_line):
@@ -22,4 +25,5 @@ def main_loop():
 
 
 if __name__ == '__main__':
+    configuration.setup_logging()
     main_loop()
\ No newline at end of file
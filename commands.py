@@ -1,84 +1,122 @@
 import re
-import json
 import os
+import sys
 from typing import Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')) # shared modules live in src
+import storage
+import journal
+import canonical
+import collection
         
 
 def load_data(file_path:str) -> Optional[dict]: 
     """
-    loads and returns a dictionary from a JSON file if possible, else return False.
+    loads and returns a dictionary from the data store if possible, else return False.
+    The store backend (JSON file or SQLite database) is chosen in config.json.
     """
+    return storage.open_store(file_path).load()
 
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump({}, f, indent=4)
-        print(f"New file created at '{file_path}'")
-        return {}
-    
-    # we try to read the file
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            if not content:
-                return {}
-    except Exception as e:
-        print(f"An unexpected error occurred while reading '{file_path}': {e}")
-        return False
-    
-    # we process the data into a dictionary.
-    data = json.loads(content)
-    if not isinstance(data, dict):
-        print(f"Warning: '{file_path}' must be a dictionary, try changing the file path.")
-    else:
-        return data
-
-def commit_data(file_path:str, data:dict):
+def commit_data(file_path:str, data:dict, save_point:Optional[dict] = None):
     """
-    write the given data to a JSON file.
+    write the given data to the data store. If save_point (the data as it was last
+    loaded or committed) is given only the entries that changed are written.
     """
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        store = storage.open_store(file_path)
+        if save_point is None:
+            store.replace_all(data)
+            store.commit()
+        else:
+            storage.apply_changes(store, save_point, data)
+            save_point.clear()
+            save_point.update(data)
         print('Data successfully committed')
         
     except Exception as e:
         print(f"Error writing to file '{file_path}': {e}, data could not be committed.")
 
-def add(arg, data_dict):
+def add(arg, data_dict, staging:Optional[journal.staging_journal] = None):
     """
-    Stages a new key-value pair in the data dictionary.
+    Stages a new key-value pair in the data dictionary, and in the staging journal if given.
     """
     add_syntax = re.compile(r'^(?P<url>\S+)+\s+as\s+(?P<label>.+)')
-    args = re.match(add_syntax, arg).groupdict()
-    if not args:
+    match = re.match(add_syntax, arg or '')
+    if not match:
         print('Invalid syntax for the add command')
         return
-    new_key, new_value = args['label'], repr(args['url'])[1:-1]
+    args = match.groupdict()
+    new_key, new_value = args['label'], canonical.canonical_url(repr(args['url'])[1:-1])
     
-    if new_key not in data_dict:
+    if data_dict.label_of(new_value) is not None:
+        print('URL already used in staging')
+    elif new_key not in data_dict:
         data_dict[new_key] = new_value
+        if staging:
+            staging.append('add', label=new_key, url=new_value)
         print(f"Key '{new_key}' with value '{new_value}' staged successfully.")
     else:
         print('key already used in staging')
 
+def import_bookmarks(arg, data_dict, staging:Optional[journal.staging_journal] = None):
+    """
+    Stages every URL of a bookmark export (Chrome/Firefox JSON, Netscape HTML) or URL list.
+    """
+    import importers # its HTML parser is only needed by this command
+    if not arg or not os.path.exists(arg):
+        print(f"Error: File not found at '{arg}'")
+        return
+
+    def journal_batch(batch):
+        if staging:
+            staging.append_many([{'op': 'add', 'label': label, 'url': url} for label, url in batch.items()])
+
+    summary = importers.merge_entries(importers.iter_entries(arg), data_dict, on_batch=journal_batch)
+    print(f"{summary['added']} entries staged from '{arg}', {summary['duplicated']} duplicated or unsupported entries skipped.")
+
+def commit_staged(staging:journal.staging_journal, save_point:dict, data:dict):
+    """
+    Folds the staging journal into the data store.
+    """
+    try:
+        staging.compact()
+        save_point.clear()
+        save_point.update(data)
+        print('Data successfully committed')
+    except Exception as e:
+        print(f"Error writing the staged changes: {e}, data could not be committed.")
+
 def print_unstaged_data(arg, data):
     print(data)
     
 def exit(arg=None,data=None):
-    pass
+    if staging_journals:
+        staging_journals[-1].close()
 
 def set_data_path(arg, data=None):
+    """
+    Opens the data file at arg and returns its committed entries, its path and the
+    staged entries, both as compact collections (see src/collection.py).
+    """
     path = arg
-    save_point = load_data(path)
+    save_point = collection.url_collection(load_data(path) or {})
 
     data_path = arg
-    staged_data = save_point.copy()
-    commands['commit'] = lambda arg, data: commit_data(data_path, data)
+    # staged changes survive restarts: they are replayed from the journal of the data file
+    staging = journal.open_journal(data_path + '.journal', *journal.store_snapshot(storage.open_store(data_path)))
+    staging_journals.append(staging)
+    staged_data = collection.url_collection(staging.recover()['urls'], key=canonical.url_key)
+    commands['add'] = lambda arg, data: add(arg, data, staging)
+    commands['import'] = lambda arg, data: import_bookmarks(arg, data, staging)
+    commands['commit'] = lambda arg, data: commit_staged(staging, save_point, data)
     print(f'path setted at {path}')
     return save_point, data_path, staged_data
 
+staging_journals = [] # journals opened by set_data_path
+
 commands = {
     "add": add,
+    "import": import_bookmarks,
     "commit": commit_data,
     "print": print_unstaged_data,
     "exit": exit
@@ -1,9 +1,13 @@
-import requests
+import sys
 from typing import Optional
-from os.path import exists
+from os.path import exists, dirname, abspath, join
 from os import mkdir, remove
 import re
 
+sys.path.append(join(dirname(abspath(__file__)), 'src')) # shared modules live in src
+import validation
+import configuration
+
 html_template = """<!DOCTYPE html>
 <html>
 <head>
@@ -14,20 +18,21 @@ html_template = """<!DOCTYPE html>
 </body>
 </html>"""
 
-def url_works(url:str) -> bool:
+def url_works(url:str, refresh:bool = False) -> bool:
     """
     Checks if a URL exists and is accessible.
     Returns True if the URL returns a successful status code (2xx),
     False otherwise, including connection errors.
+    Results are kept in the validation cache, refresh forces a new request.
     """
-    try:
-        response = requests.head(url, timeout=5) # Add a timeout to prevent hanging
-        print(f"URL successfully read, status code:{response.status_code}")
-        return 200 <= response.status_code < 300
-    except requests.exceptions.RequestException as e:
-        # This catches various errors like ConnectionError, Timeout, TooManyRedirects, etc.
-        print(f"Error checking URL {url}: {e}")
-        return False
+    result = validation.validate_urls([url], refresh=refresh)[0]
+    if result['cached']:
+        print(f"URL found in the validation cache, status code:{result['status']}")
+    elif result['error']:
+        print(f"Error checking URL {url}: {result['error']}")
+    else:
+        print(f"URL successfully read, status code:{result['status']}")
+    return result['valid']
 
 def new_file_name(directory:str, extension:str, default_name = 'New file'):
     """
@@ -141,4 +146,5 @@ def test():
     
 
 if __name__ == '__main__':
+    configuration.setup_logging()
     test()
\ No newline at end of file
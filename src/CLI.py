@@ -1,36 +1,79 @@
 import re
-import json
-from os.path import exists
+import sys
+import time
+from typing import Optional
 import main
+import configuration
+import metrics
+import validation
+import journal
+import jobs
+import canonical
+import collection
 
 class session:
-    def __init__(self, config):
+    def __init__(self, config, staging:journal.staging_journal = None):
         self.config = config
         self.folder = config['tab_folder']
         self.open_file = False
-        self.urls = {}
+        self.urls = new_collection()
         self.file_path = None
         self.open_file = None
+        self.staging = staging
+        self.jobs = jobs.job_manager()
+        if staging:
+            self.restore(staging.recover())
+
+    def restore(self, state:dict):
+        """
+        Continues the session saved in the staging journal by a previous run.
+        """
+        self.urls = new_collection(state['urls'])
+        self.open_file = state['meta'].get('open_file')
+        if self.open_file:
+            self.file_path = self.folder + '/' + self.open_file
+
+    def log(self, *operations):
+        if self.staging:
+            self.staging.append_many(list(operations))
         
     def open_group(self, file_name):
-        path = app.folder + '/' + file_name
-        urls = main.load_group_urls(path)
+        if file_name.endswith('.html'):
+            file_name = file_name[:-len('.html')]
+        path = self.folder + '/' + file_name + '.html'
+        urls = main.load_group_url_list(path)
         if urls:
-            self.urls = urls
+            self.urls = collection.url_collection.from_urls(urls, key=canonical.url_key) # group files keep no labels
             self.file_path = path
             self.open_file = file_name
+            self.log(
+                {'op': 'reset', 'urls': dict(self.urls.items())},
+                {'op': 'meta', 'key': 'open_file', 'value': file_name}
+            )
             
     def new_group(self, file_name):
         if self.urls:
-            self.file_path = app.folder + '/' + file_name
+            self.file_path = self.folder + '/' + file_name
             self.open_file = file_name
+            self.log({'op': 'meta', 'key': 'open_file', 'value': file_name})
         else:
             print('cant create file with no URLs')
+
+    def staged_label(self, url:str):
+        """
+        Returns the label a URL equivalent to url was staged with, or None.
+        """
+        return self.urls.label_of(url)
+
+    def stage(self, label:str, url:str):
+        self.urls[label] = url
+        self.log({'op': 'add', 'label': label, 'url': url})
+
     def info(self):
         info_dict = {
-            "Opened file": app.open_file,
-            "Folder": app.folder,
-            "URLs": app.urls
+            "Opened file": self.open_file,
+            "Folder": self.folder,
+            "URLs": self.urls
         }
         return info_dict
         
@@ -42,11 +85,19 @@ class session:
         self._run = value
         
 
+def new_collection(items = ()) -> collection.url_collection:
+    """
+    Returns a compact {label: url} collection whose URLs are compared by their canonical key.
+    """
+    return collection.url_collection(items, key=canonical.url_key)
+
 command_syntax = re.compile(
         r"^(?P<function>[a-zA-Z0-9]+)"  # Command name (at least one letter or number)
         r"(?:(?: +)-(?P<flags>[a-zA-Z0-9]+))?"  # Optional flags (space, '-', then letters/numbers)
         r"(?: +(?P<arguments>.*))?$"  # Optional arguments (space, then any characters until end of line)
     )
+FIND_LIMIT = 50 # matches printed by the find command
+add_syntax = re.compile(r'^(?P<url>\S+)+\s+as\s+(?P<label>.+)')
 
 def open_group(args, flags, app:session):
     app.open_group(file_name = args)
@@ -57,33 +108,243 @@ def add(args, flags, app:session): # check syntax
     """
     stages a new URL to be saved later
     """
-    add_syntax = re.compile(r'^(?P<url>\S+)+\s+as\s+(?P<label>.+)')
-    args = re.match(add_syntax, args).groupdict()
-    if not args:
+    match = re.match(add_syntax, args or '')
+    if not match:
         print('Invalid syntax for the add command')
         return
-    new_key, new_value = args['label'], repr(args['url'])[1:-1]
+    args = match.groupdict()
+    new_key, new_value = args['label'], canonical.canonical_url(repr(args['url'])[1:-1])
     
-    if new_key not in app.urls:
-        app.urls[new_key] = new_value
+    if app.staged_label(new_value) is not None:
+        print(f"URL already staged as '{app.staged_label(new_value)}'")
+    elif new_key not in app.urls:
+        app.stage(new_key, new_value)
+        app.jobs.prevalidate([new_value]) # so a later save finds it in the validation cache
         print(f"Key '{new_key}' with value '{new_value}' staged successfully.")
     else:
         print('key already staged')
 
+def import_bookmarks(args, flags, app:session):
+    """
+    imports bookmarks (Chrome/Firefox JSON, Netscape HTML) or a URL list into the data file,
+    flags can force the format: -json, -html or -list
+    """
+    import importers # its HTML parser is only needed by this command
+    if not args:
+        print('Usage: import [-json|-html|-list] <file path>')
+        return
+    if flags and flags not in importers.readers:
+        print(f'Unknown import format: {flags}')
+        return
+    current = app.jobs.submit(
+        f'import {args}',
+        lambda job: importers.import_file(args, app.config['path'], file_format=flags, on_progress=job.progress)
+    )
+    print(f'Started job [{current.id}] {current.name}')
+
+def stats(args, flags, app:session):
+    """
+    shows the metrics collected in this session, flags: -on, -off, -reset,
+    with a file path as argument the metrics are also written there as JSON
+    """
+    match flags:
+        case 'on':
+            metrics.enable(True)
+        case 'off':
+            metrics.enable(False)
+        case 'reset':
+            metrics.reset()
+    if not metrics.enabled:
+        print('Metrics are disabled, use "stats -on" or set metrics.enabled in config.json')
+    print(metrics.dump(args))
+
 def print_data(args, flags, app:session):
     print(app.info())
 
 def save_to_file(args, flags, app:session):
+    """
+    saves the staged URLs to the open group file in a background job, -new <name> saves to a new file
+    """
     match flags:
         case 'new':
             app.new_group(args)
-            
-    main.create_group_file(
-        url = app.urls, 
-        destination=app.folder,
-        file_name=app.open_file,
-        overwrite=True
+    if not app.open_file:
+        print('No file is open, use "save -new <name>"')
+        return
+
+    urls = list(app.urls.values())
+    file_name = app.open_file
+    current = app.jobs.submit(
+        f'save {file_name}',
+        lambda job: main.create_group_file(
+            url = urls, 
+            destination=app.folder,
+            file_name=file_name,
+            overwrite=True,
+            on_progress=job.progress,
+            cancel_event=job.cancel_event
+        )
+    )
+    print(f'Started job [{current.id}] {current.name}')
+
+def validate(args, flags, app:session):
+    """
+    checks the staged URLs in a background job and reports the ones that do not work, -refresh ignores the cache
+    """
+    urls = list(app.urls.values())
+
+    def run(job):
+        results = validation.validate_urls(
+            urls, refresh=flags == 'refresh', on_progress=job.progress, cancel_event=job.cancel_event
+        )
+        invalid = [result['url'] for result in results if not result['valid']]
+        for url in invalid:
+            print(f'invalid url: {url}')
+        return invalid
+
+    current = app.jobs.submit(f'validate {len(urls)} URLs', run)
+    print(f'Started job [{current.id}] {current.name}')
+
+def find(args, flags, app:session):
+    """
+    finds the saved files and data entries whose URL or label contains the argument,
+    -host finds the ones on a host or its subdomains, -refresh also checks files edited by other programs
+    """
+    import search_index
+    if not args:
+        print('Usage: find [-host|-refresh] <text>')
+        return
+    start = time.perf_counter()
+    index = search_index.open_index(app.folder, app.config.get('path'))
+    index.refresh(full=flags == 'refresh')
+    results = index.find(args, host=flags == 'host')
+    elapsed = time.perf_counter() - start
+
+    for result in results[:FIND_LIMIT]:
+        where = result['name'] if result['source'] == 'file' else f"data entry '{result['label']}'"
+        print(f"{where}: {result['url']}")
+    if len(results) > FIND_LIMIT:
+        print(f'... and {len(results) - FIND_LIMIT} more')
+    files = len({result['name'] for result in results if result['source'] == 'file'})
+    print(f'{len(results)} matches in {files} files and the data store ({elapsed * 1000:.1f} ms)')
+
+def scan_folder(app:session) -> tuple[dict, float]:
+    import folder_scan
+    start = time.perf_counter()
+    entries = folder_scan.scan(app.folder)
+    return entries, time.perf_counter() - start
+
+def modified(entry:dict) -> str:
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['mtime']))
+
+def list_files(args, flags, app:session):
+    """
+    lists the groups and archives of the tab folder with their URL counts and last
+    modification, -all also lists the single files, a text argument filters the names
+    """
+    entries, elapsed = scan_folder(app)
+    shown = [
+        (name, entry) for name, entry in sorted(entries.items())
+        if (flags == 'all' or entry['kind'] != 'single') and (not args or args.lower() in name.lower())
+    ]
+    width = max((len(name) for name, entry in shown), default=0)
+    for name, entry in shown:
+        parts = f" in {entry['parts']} parts" if entry['kind'] == 'sharded' else ''
+        print(f"{name:<{width}}  {entry['kind']:<7}  {len(entry['urls']):>6} URLs{parts}  {modified(entry)}")
+    print(f'{len(shown)} of {len(entries)} files listed ({elapsed * 1000:.1f} ms)')
+
+def overview(args, flags, app:session):
+    """
+    summarizes the tab folder: files and URLs of each kind, distinct URLs, largest groups and latest changes
+    """
+    entries, elapsed = scan_folder(app)
+    if not entries:
+        print(f"No generated files in '{app.folder}'")
+        return
+    kinds = {}
+    for entry in entries.values():
+        files, urls = kinds.get(entry['kind'], (0, 0))
+        kinds[entry['kind']] = (files + 1, urls + len(entry['urls']))
+    distinct = len({canonical.url_key(url) for entry in entries.values() for url in entry['urls']})
+    groups = sorted(
+        ((name, entry) for name, entry in entries.items() if entry['kind'] in ('group', 'sharded')),
+        key=lambda item: len(item[1]['urls']), reverse=True
     )
+    latest = max(entries.items(), key=lambda item: item[1]['mtime'])
+
+    print(f"Folder: {app.folder}")
+    for kind, (files, urls) in sorted(kinds.items()):
+        print(f'  {kind}: {files} files, {urls} URLs')
+    print(f'  distinct URLs: {distinct}')
+    if groups:
+        print('Largest groups:')
+        for name, entry in groups[:5]:
+            print(f"  {name}: {len(entry['urls'])} URLs")
+    print(f'Last modified: {latest[0]} ({modified(latest[1])})')
+    print(f'{len(entries)} files scanned in {elapsed * 1000:.1f} ms')
+
+AUDIT_LIMIT = 20 # links of each class printed by "audit -summary"
+
+def audit(args, flags, app:session):
+    """
+    checks every URL of the tab folder and the data store in a background job, resuming an
+    interrupted audit, -restart starts over, -refresh ignores the validation cache,
+    -summary prints the results so far, -fix removes dead links and replaces redirects in the saved files
+    """
+    import audit as link_audit
+    current_audit = link_audit.link_audit(app.folder, app.config.get('path'))
+    match flags:
+        case 'summary':
+            records = {}
+            for record in current_audit.read_report():
+                records.setdefault(link_audit.classify(record, current_audit.settings), []).append(record)
+            checkpoint = current_audit.load_checkpoint()
+            if checkpoint is None:
+                print('No audit was run yet, use "audit"')
+                return
+            print(f"{'Finished' if checkpoint.get('complete') else 'Interrupted'} audit, report at '{current_audit.report_path}'")
+            for kind, count in checkpoint['counts'].items():
+                print(f'  {kind}: {count}')
+            for kind in ('dead', 'redirected', 'unreachable'):
+                for record in records.get(kind, [])[:AUDIT_LIMIT]:
+                    print(f"{kind}: {record['url']}" + (f" -> {record['final_url']}" if kind == 'redirected' else ''))
+            return
+        case 'fix':
+            checkpoint = current_audit.load_checkpoint()
+            if checkpoint is None or not checkpoint.get('complete'):
+                print('The audit is not finished, run "audit" first')
+                return
+            current = app.jobs.submit('audit fix', lambda job: current_audit.fix())
+        case _:
+            current = app.jobs.submit(
+                'audit',
+                lambda job: current_audit.run(
+                    refresh=flags == 'refresh', restart=flags == 'restart',
+                    on_progress=job.progress, cancel_event=job.cancel_event
+                )
+            )
+    print(f'Started job [{current.id}] {current.name}')
+
+def list_jobs(args, flags, app:session):
+    if not app.jobs.jobs:
+        print('No jobs started in this session')
+    for current in app.jobs.jobs.values():
+        print(current.describe())
+
+def wait(args, flags, app:session):
+    """
+    waits for a job to finish, or for every running job if no id is given
+    """
+    if args and app.jobs.get(args) is None:
+        print(f'No job with id {args}')
+        return
+    app.jobs.wait(args)
+
+def cancel(args, flags, app:session):
+    if app.jobs.cancel(args):
+        print(f'Job [{args}] will stop as soon as possible')
+    else:
+        print(f'No running job with id {args}')
 
 def exit(args, flags, app:session):
     match flags:
@@ -92,25 +353,46 @@ def exit(args, flags, app:session):
         case 'save':
             save_to_file(None, None, app)
             
+    if app.jobs.active():
+        print(f'Waiting for {len(app.jobs.active())} jobs to finish...')
+    app.jobs.shutdown(wait=True)
+    if app.staging:
+        app.staging.close()
     app.run = False
     
 commands = {
     "open": open_group,
     "add" : add,
+    "import": import_bookmarks,
     "print": print_data,
+    "stats": stats,
     "save": save_to_file,
+    "validate": validate,
+    "find": find,
+    "list": list_files,
+    "overview": overview,
+    "audit": audit,
+    "jobs": list_jobs,
+    "wait": wait,
+    "cancel": cancel,
     "exit": exit
 }
 
 def init_session():
-    with open('config.json', 'r', encoding='utf-8') as f:
-        content = f.read()
-        config = json.loads(content)
-    return session(config)
+    config = configuration.load_config('config.json')
+    configuration.setup_logging(config)
+    metrics.setup(config)
+    settings = configuration.config_section('journal', journal.default_settings)
+    load_snapshot, fold = journal.json_snapshot(settings['session_path'] + '.json')
+    staging = journal.open_journal(settings['session_path'] + '.journal', load_snapshot, fold, settings)
+    return session(config, staging)
 
 def execute_command(command:dict, app:session):
     function_key = command.get('function')
-    function = commands['function_key']
+    function = commands.get(function_key)
+    if function is None:
+        print(f'Unknown command: {function_key}')
+        return
     flags = command.get('flags') # not fully implemented yet
     arguments = command.get('arguments')
     return function(arguments, flags, app)
@@ -123,14 +405,167 @@ def parse_command(input_line:str):
 
 def main_loop(app:session):
     app.run = True
-    input_line = input()
     while app.run:
+        try:
+            input_line = input()
+        except EOFError: # end of piped input, the staged URLs stay in the journal
+            exit(None, None, app)
+            break
         command = parse_command(input_line)
         if command:
             execute_command(command, app)
 
-        input_line = input()
+script_commands = {'open', 'add', 'save', 'validate', 'import', 'print', 'exit'}
+
+def parse_script(lines) -> tuple[list[tuple[int, dict]], list[str]]:
+    """
+    Parses a whole command script before anything runs. Returns the (line number, command)
+    pairs and the errors found. Empty lines and lines starting with '#' are ignored.
+    """
+    steps = []
+    errors = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        command = parse_command(line)
+        if not command:
+            errors.append(f'line {number}: invalid syntax: {line}')
+            continue
+        if command['function'] not in script_commands:
+            errors.append(f"line {number}: '{command['function']}' can't be used in a script")
+            continue
+        if command['function'] == 'add':
+            match = add_syntax.match(command['arguments'] or '')
+            if not match:
+                errors.append(f'line {number}: invalid syntax for the add command: {line}')
+                continue
+            command['label'], command['url'] = match.group('label'), canonical.canonical_url(repr(match.group('url'))[1:-1])
+        elif command['function'] in ('open', 'import') and not command['arguments']:
+            errors.append(f"line {number}: {command['function']} needs a file name")
+            continue
+        steps.append((number, command))
+        if command['function'] == 'exit':
+            break
+    return steps, errors
+
+def run_script(lines, app:session) -> bool:
+    """
+    Runs a command script in batch mode. The whole script is parsed first and nothing
+    runs if it has errors. URLs are staged in memory, every URL of the script is
+    validated in a single run and each saved file is written once, with the URLs it
+    had at its last save. Returns True if the script ran without errors.
+    """
+    steps, errors = parse_script(lines)
+    for error in errors:
+        print(error)
+    if errors:
+        print(f'{len(errors)} errors found, the script was not run')
+        return False
+
+    urls = app.urls.copy()
+    open_file = app.open_file
+    targets = {} # file name -> URLs at its last save
+    checks = [] # (line number, URLs) of the validate commands
+    failed = 0
+
+    def save(number, new_file = None):
+        nonlocal open_file, failed
+        if new_file:
+            if not urls:
+                print(f'line {number}: cant create file with no URLs')
+                failed += 1
+                return
+            open_file = new_file
+        if not open_file:
+            print(f'line {number}: no file is open, use "save -new <name>"')
+            failed += 1
+            return
+        targets[open_file] = list(urls.values())
+
+    for number, command in steps:
+        arguments, flags = command['arguments'], command['flags']
+        match command['function']:
+            case 'add':
+                if urls.label_of(command['url']) is not None:
+                    print(f"line {number}: URL already staged as '{urls.label_of(command['url'])}'")
+                elif command['label'] in urls:
+                    print(f"line {number}: key '{command['label']}' already staged")
+                else:
+                    urls[command['label']] = command['url']
+            case 'open':
+                file_name = arguments[:-len('.html')] if arguments.endswith('.html') else arguments
+                loaded = main.load_group_url_list(app.folder + '/' + file_name + '.html')
+                if not loaded:
+                    print(f"line {number}: no URLs could be read from '{file_name}'")
+                    failed += 1
+                    continue
+                urls = collection.url_collection.from_urls(loaded, key=canonical.url_key)
+                open_file = file_name
+            case 'save':
+                save(number, arguments if flags == 'new' else None)
+            case 'exit':
+                if flags == 'save':
+                    save(number)
+            case 'validate':
+                checks.append((number, list(urls.values())))
+            case 'import':
+                import importers
+                importers.import_file(arguments, app.config['path'], file_format=flags)
+            case 'print':
+                print({"Opened file": open_file, "Folder": app.folder, "URLs": urls})
+
+    to_validate = list(dict.fromkeys(
+        url for url_list in [*targets.values(), *(url_list for number, url_list in checks)] for url in url_list
+    ))
+    results = {result['url']: result for result in validation.validate_urls(to_validate)}
+    for number, url_list in checks:
+        for url in url_list:
+            if not results[url]['valid']:
+                print(f'line {number}: invalid url: {url}')
+
+    for file_name, url_list in targets.items():
+        accepted_urls = [url for url in url_list if results[url]['valid']]
+        for url in url_list:
+            if not results[url]['valid']:
+                print(f'{file_name}: invalid url not added: {url}')
+        path = main.get_valid_path(app.folder, file_name, default_name=file_name, url_list=accepted_urls, overwrite=True)
+        if path:
+            main.write_group(path, accepted_urls)
+            print(f'{path} written with {len(accepted_urls)} URLs')
+
+    print(f'{len(steps)} commands run, {len(targets)} files saved, {failed} errors')
+    return not failed
+
+def parse_arguments(argv:list[str]) -> Optional[str]:
+    """
+    Returns the script given with --script, or None for an interactive session.
+    The usual forms are read directly; argparse, which takes longer to import than
+    a quick command takes to run, only handles the others (--help, errors).
+    """
+    if not argv:
+        return None
+    if len(argv) == 2 and argv[0] == '--script':
+        return argv[1]
+    if len(argv) == 1 and argv[0].startswith('--script='):
+        return argv[0][len('--script='):]
+    import argparse
+    parser = argparse.ArgumentParser(description='Stages URLs and saves them as group files.')
+    parser.add_argument('--script', help="runs the commands of a file in batch mode, '-' reads them from stdin")
+    return parser.parse_args(argv).script
 
 if __name__ == '__main__':
+    script = parse_arguments(sys.argv[1:])
+
     app = init_session()
-    main_loop(app)
\ No newline at end of file
+    if script is None:
+        main_loop(app)
+    else:
+        if script == '-':
+            succeeded = run_script(sys.stdin, app)
+        else:
+            with open(script, 'r', encoding='utf-8') as f:
+                succeeded = run_script(f, app)
+        app.jobs.shutdown(wait=True)
+        app.staging.close()
+        sys.exit(0 if succeeded else 1)
\ No newline at end of file
@@ -1,14 +1,93 @@
+import argparse
+import logging
+import time
 import main
+import validation
+import bulk
+import incremental
+import configuration
+import metrics
+import watch
 
-def generate_singles_from_file(path = 'URLs.json'): 
-    data = main.load_data(path)
-    for name, url in data.items():
-        main.create_single_file(file_name=name,url=url)
+logger = logging.getLogger(__name__)
+
+def generate_singles_from_file(path = 'URLs.json', max_workers = validation.MAX_WORKERS, incremental_build = False): 
+    data = main.load_collection(path)
+    if incremental_build:
+        return incremental.build_singles(data, max_workers=max_workers)
+    return bulk.generate_singles(data, max_workers=max_workers)
+
+def generate_packed_from_file(path = 'URLs.json', max_workers = validation.MAX_WORKERS):
+    import packing
+    data = main.load_collection(path)
+    return packing.pack_singles(data, max_workers=max_workers)
         
-def generate_group(path = 'URLs.json'):
-    data = main.load_data(path)
-    urls = data.values()
-    main.create_group_file(urls,file_name='Studying resources')
+def generate_group(path = 'URLs.json', max_workers = validation.MAX_WORKERS, incremental_build = False):
+    data = main.load_collection(path)
+    urls = list(data.values())
+    if incremental_build:
+        return incremental.build_group(urls, file_name='Studying resources', max_workers=max_workers)
+    main.create_group_file(urls, file_name='Studying resources', max_workers=max_workers)
         
+def watch_data(path = 'URLs.json', singles = False, max_workers = validation.MAX_WORKERS):
+    """
+    Builds the outputs of the data file, then rebuilds them every time it changes.
+    Only the labels that changed are looked at in singles mode, and a group only
+    requests the URLs that are not in the validation cache.
+    """
+    data = watch.read_data(path)
+    if data is None:
+        logger.warning(f"Warning: '{path}' could not be read, waiting for a valid version.")
+        data = {}
+    elif singles:
+        incremental.build_singles(data, max_workers=max_workers)
+    else:
+        incremental.build_group(list(data.values()), file_name='Studying resources', max_workers=max_workers)
+
+    def on_change():
+        nonlocal data
+        new_data = watch.read_data(path)
+        if new_data is None:
+            logger.warning(f"Warning: the data of '{path}' could not be read yet, waiting for the next save.")
+            return
+        changes = watch.diff(data, new_data)
+        if not any(changes.values()):
+            return
+        start = time.perf_counter()
+        if singles:
+            changed_labels = changes['added'] + changes['changed'] + changes['removed']
+            incremental.build_singles(new_data, max_workers=max_workers, only=changed_labels)
+        else:
+            incremental.build_group(list(new_data.values()), file_name='Studying resources', max_workers=max_workers)
+        data = new_data
+        logger.info(
+            f"{len(changes['added'])} added, {len(changes['changed'])} changed, {len(changes['removed'])} removed "
+            f"labels handled in {time.perf_counter() - start:.2f}s"
+        )
+
+    watch.watch(path, on_change)
+
 if __name__ == '__main__':
-    generate_group()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Generates tab files from a JSON file of URLs.')
+    parser.add_argument('path', nargs='?', default='URLs.json')
+    parser.add_argument('--singles', action='store_true', help='create one file per URL instead of a group')
+    parser.add_argument('--packed', action='store_true', help='write the single files as entries of one zip archive')
+    parser.add_argument('--incremental', action='store_true', help='only rebuild entries that changed since the last run')
+    parser.add_argument('--metrics', metavar='PATH', help='write the metrics of the run to a JSON file')
+    parser.add_argument('--watch', action='store_true', help='keep running and rebuild the outputs when the data file changes')
+    args = parser.parse_args()
+    config = configuration.load_config()
+    configuration.setup_logging(config)
+    metrics.setup(config)
+    if args.metrics:
+        metrics.enable(True)
+    if args.watch:
+        watch_data(args.path, singles=args.singles)
+    elif args.packed:
+        generate_packed_from_file(args.path)
+    elif args.singles:
+        generate_singles_from_file(args.path, incremental_build=args.incremental)
+    else:
+        generate_group(args.path, incremental_build=args.incremental)
+    if args.metrics:
+        metrics.dump(args.metrics)
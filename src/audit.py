@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import time
+from typing import Callable, Iterator, Optional
+import canonical
+import configuration
+import folder_scan
+import main
+import manifest
+import rendering
+import storage
+import validation
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "report_path": "Link audit.jsonl", # one JSON result per line, the checkpoint is kept next to it
+    "batch_size": 1000, # URLs validated between two checkpoints
+    "dead_statuses": [404, 410], # statuses of links removed by a fix
+    "remove_unreachable": False, # also remove links whose host could not be reached
+    "replace_redirects": True # replace redirected links by the URL they lead to
+}
+
+CHECKPOINT_VERSION = 1
+
+def classify(record:dict, settings:dict = default_settings) -> str:
+    """
+    Returns 'ok', 'redirected', 'dead', 'unreachable' or 'failing' (any other error
+    status, left alone by fixes) for a result of the report.
+    """
+    if record['valid']:
+        final_url = record.get('final_url')
+        if final_url and canonical.url_key(final_url) != canonical.url_key(record['url']):
+            return 'redirected'
+        return 'ok'
+    if record['status'] in settings['dead_statuses']:
+        return 'dead'
+    if record['status'] is None:
+        return 'unreachable'
+    return 'failing'
+
+def iter_urls(folder:str, data_path:Optional[str] = None) -> Iterator[str]:
+    """
+    Yields every distinct URL of the files of the tab folder, then of the data store.
+    """
+    seen = set()
+    for file_name, entry in sorted(folder_scan.scan(folder).items()):
+        for url in entry['urls']:
+            if url not in seen:
+                seen.add(url)
+                yield url
+    if data_path:
+        for page in storage.open_store(data_path).iter_pages():
+            for label, url in page:
+                if url not in seen:
+                    seen.add(url)
+                    yield url
+
+class link_audit:
+    """
+    Checks every URL of a tab folder and of the data store, writing one result per
+    line to a JSONL report.
+
+    URLs are validated in batches; after each one the report is flushed to the disk
+    and a checkpoint records its size and the counts so far. An interrupted audit
+    cuts the report back to its last checkpoint and only checks the URLs that are
+    not in it yet. fix() then rewrites the saved files from the report.
+    """
+    def __init__(self, folder:str, data_path:Optional[str] = None, settings:Optional[dict] = None):
+        self.folder = folder
+        self.data_path = data_path
+        self.settings = configuration.config_section('audit', default_settings) if settings is None else settings
+        self.report_path = self.settings['report_path']
+        self.checkpoint_path = self.report_path + '.checkpoint'
+
+    def load_checkpoint(self) -> Optional[dict]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Warning: the audit checkpoint could not be read, the audit starts over: {e}")
+            return None
+        return checkpoint if checkpoint.get('version') == CHECKPOINT_VERSION else None
+
+    def save_checkpoint(self, checkpoint:dict):
+        with rendering.atomic_file(self.checkpoint_path, sync=True) as f:
+            json.dump(dict(checkpoint, version=CHECKPOINT_VERSION), f)
+
+    def read_report(self) -> Iterator[dict]:
+        """
+        Yields the results of the report up to its last checkpoint.
+        """
+        checkpoint = self.load_checkpoint()
+        if checkpoint is None or not os.path.exists(self.report_path):
+            return
+        with open(self.report_path, 'rb') as f:
+            while f.tell() < checkpoint['report_size']:
+                line = f.readline()
+                if not line:
+                    break
+                yield json.loads(line)
+
+    def run(
+        self,
+        refresh:bool = False,
+        restart:bool = False,
+        on_progress:Optional[Callable[[int, int], None]] = None,
+        cancel_event = None
+    ) -> dict:
+        """
+        Runs the audit, resuming the last one unless it finished or restart is True.
+        Results in the validation cache are reused unless refresh is True. Returns
+        the counts of checked URLs of each class (see classify).
+        """
+        checkpoint = None if restart else self.load_checkpoint()
+        if checkpoint and (checkpoint.get('complete') or not os.path.exists(self.report_path)):
+            checkpoint = None
+        done = set()
+        if checkpoint:
+            with open(self.report_path, 'r+b') as f:
+                f.truncate(checkpoint['report_size']) # results written after the checkpoint may be cut
+            done = {record['url'] for record in self.read_report()}
+            counts = checkpoint['counts']
+            logger.info(f'Resuming the audit after {len(done)} URLs')
+        else:
+            open(self.report_path, 'wb').close()
+            counts = {'ok': 0, 'redirected': 0, 'dead': 0, 'unreachable': 0, 'failing': 0}
+            checkpoint = {'started': time.time(), 'report_size': 0, 'counts': counts, 'complete': False}
+            self.save_checkpoint(checkpoint)
+
+        urls = [url for url in iter_urls(self.folder, self.data_path) if url not in done]
+        total = len(done) + len(urls)
+        batch_size = max(1, self.settings['batch_size'])
+        with open(self.report_path, 'ab') as report:
+            for start in range(0, len(urls), batch_size):
+                checked = len(done) + start
+                results = validation.validate_urls(
+                    urls[start:start + batch_size],
+                    refresh=refresh,
+                    on_progress=(lambda n, batch_total: on_progress(checked + n, total)) if on_progress else None,
+                    cancel_event=cancel_event
+                )
+                for result in results:
+                    record = {key: result[key] for key in ('url', 'valid', 'status', 'final_url', 'error')}
+                    counts[classify(record, self.settings)] += 1
+                    report.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+                report.flush()
+                os.fsync(report.fileno())
+                self.save_checkpoint(dict(checkpoint, report_size=report.tell(), counts=counts))
+            checkpoint = dict(checkpoint, report_size=report.tell(), counts=counts, complete=True, finished=time.time())
+        self.save_checkpoint(checkpoint)
+        logger.info(
+            f"{total} URLs audited: {counts['ok']} ok, {counts['redirected']} redirected, {counts['dead']} dead, "
+            f"{counts['unreachable']} unreachable, {counts['failing']} failing."
+        )
+        return counts
+
+    def replacements(self) -> dict:
+        """
+        Returns {url: new URL, or None to remove it} for the links the report says to change.
+        """
+        changes = {}
+        for record in self.read_report():
+            match classify(record, self.settings):
+                case 'dead':
+                    changes[record['url']] = None
+                case 'unreachable' if self.settings['remove_unreachable']:
+                    changes[record['url']] = None
+                case 'redirected' if self.settings['replace_redirects']:
+                    changes[record['url']] = canonical.canonical_url(record['final_url'])
+        return changes
+
+    def fix(self) -> dict:
+        """
+        Rewrites the groups, single files and archives of the tab folder in a single
+        pass, removing dead links and replacing redirected ones. Files left without
+        URLs are deleted. The data store is not changed. Returns the counts of
+        rewritten and deleted files and of removed and replaced URLs.
+        """
+        changes = self.replacements()
+        summary = {'rewritten': 0, 'deleted': 0, 'removed': 0, 'replaced': 0}
+        if not changes:
+            return summary
+        index = manifest.open_manifest(self.folder)
+
+        def apply(urls):
+            new_urls = []
+            for url in urls:
+                new_url = changes.get(url, url)
+                if new_url is None:
+                    summary['removed'] += 1
+                    continue
+                if new_url != url:
+                    summary['replaced'] += 1
+                new_urls.append(new_url)
+            return new_urls
+
+        def delete(file_name):
+            os.remove(self.folder + '/' + file_name)
+            index.forget(file_name, save=False)
+            summary['deleted'] += 1
+
+        for file_name, entry in sorted(folder_scan.scan(self.folder).items()):
+            if not any(url in changes for url in entry['urls']):
+                continue
+            path = self.folder + '/' + file_name
+            match entry['kind']:
+                case 'group' | 'sharded':
+                    new_urls = canonical.dedupe(apply(entry['urls']))
+                    if new_urls:
+                        main.write_group(path, new_urls, save_manifest=False)
+                        summary['rewritten'] += 1
+                    else:
+                        import sharding
+                        sharding.remove_parts(path)
+                        delete(file_name)
+                case 'single':
+                    new_urls = apply(entry['urls'])
+                    if new_urls:
+                        main.write_generated_file(path, main.render_single(new_urls[0]), new_urls, save_manifest=False)
+                        summary['rewritten'] += 1
+                    else:
+                        delete(file_name)
+                case 'archive':
+                    import packing
+                    entries, removed = [], []
+                    for label, url in zip(entry['labels'], entry['urls']):
+                        if url in changes:
+                            new_urls = apply([url])
+                            if new_urls:
+                                entries.append((label + '.html', main.render_single(new_urls[0])))
+                            else:
+                                removed.append(label + '.html')
+                    packing.open_archive(path).append(entries, removed)
+                    summary['rewritten'] += 1
+        index.save()
+        logger.info(
+            f"{summary['rewritten']} files rewritten, {summary['deleted']} deleted, "
+            f"{summary['removed']} links removed, {summary['replaced']} redirects replaced."
+        )
+        return summary
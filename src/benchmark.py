@@ -0,0 +1,337 @@
+import argparse
+import compileall
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import main
+import manifest
+import scheduler
+import url_cache
+import validation
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+NETWORK_SIZE_LIMIT = 1000 # largest dataset sent through the HTTP server by default
+STARTUP_TARGET = 0.05 # seconds a quick CLI command may add to the start of the interpreter
+HEAVY_MODULES = ('requests', 'urllib3', 'sqlite3', 'hashlib', 'concurrent.futures', 'html.parser')
+SOURCE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+class stand_in_handler(BaseHTTPRequestHandler):
+    """
+    Answers every request locally. The behavior of a URL comes from its query string:
+    ?status=404 answers with that status, ?delay=0.2 waits that many seconds and
+    ?redirect=3 goes through that many redirects before answering.
+    ?head=405 answers HEAD requests with that status (GET requests still work).
+    ?throttle=2 answers 429 to the first two requests of the URL, with the Retry-After
+    header of ?retry_after=1 if given.
+    Missing values use the defaults of the server.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self, method:str):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        time.sleep(float(query.get('delay', self.server.latency)))
+
+        redirects = int(query.get('redirect', 0))
+        if redirects > 0:
+            query['redirect'] = str(redirects - 1)
+            location = url.path + '?' + '&'.join(f'{key}={value}' for key, value in query.items())
+            self.send_response(302)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        status = int(query.get('status', self.server.status))
+        if method == 'HEAD' and 'head' in query:
+            status = int(query['head'])
+        throttled = False
+        if 'throttle' in query:
+            with self.server.hits_lock:
+                self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+                throttled = self.server.hits[self.path] <= int(query['throttle'])
+        body = b'stand-in page'
+        if throttled:
+            self.send_response(429)
+            if 'retry_after' in query:
+                self.send_header('Retry-After', query['retry_after'])
+        else:
+            self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if method == 'GET':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.respond('HEAD')
+
+    def do_GET(self):
+        self.respond('GET')
+
+    def log_message(self, format, *args):
+        pass # keeps the benchmark output clean
+
+class stand_in_server:
+    """
+    Local HTTP server used instead of real websites, runs in a background thread.
+    """
+    def __init__(self, latency:float = 0.0, status:int = 200):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), stand_in_handler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.status = status
+        self.httpd.hits = {} # requests received by each throttled URL
+        self.httpd.hits_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.httpd.server_port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def synthetic_urls(base_url:str, size:int, seed:int = 0) -> list[str]:
+    """
+    Returns size URLs of the stand-in server, about one in ten of them failing
+    and one in ten going through a redirect.
+    """
+    rng = random.Random(seed)
+    urls = []
+    for i in range(size):
+        roll = rng.random()
+        if roll < 0.1:
+            urls.append(f'{base_url}/page/{i}?status=404')
+        elif roll < 0.2:
+            urls.append(f'{base_url}/page/{i}?redirect=1')
+        else:
+            urls.append(f'{base_url}/page/{i}')
+    return urls
+
+@contextlib.contextmanager
+def silenced():
+    """
+    Silences the output and the log messages of the code run in the block.
+    """
+    previous = logging.root.manager.disable
+    logging.disable(logging.CRITICAL)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(previous)
+
+def measure(function, repeat:int = 1) -> dict:
+    """
+    Runs function repeat times with its output silenced and returns timing statistics.
+    """
+    times = []
+    for _ in range(repeat):
+        with silenced():
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    return {'best': min(times), 'mean': sum(times) / len(times), 'repeat': repeat}
+
+def bench_validation(urls:list[str], max_workers:int) -> dict:
+    no_cache = url_cache.validation_cache(enabled=False)
+    result = measure(lambda: validation.validate_urls(urls, max_workers=max_workers, cache=no_cache))
+    result['urls_per_second'] = len(urls) / result['best'] if result['best'] else None
+    return result
+
+def bench_throttled(base_url:str, size:int, max_workers:int) -> dict:
+    """
+    Validates URLs that answer 429 to their first two requests, half of them with a
+    Retry-After header, and reports how many ended up valid.
+    """
+    urls = [
+        f'{base_url}/throttled/{i}?throttle=2' + ('&retry_after=0' if i % 2 else '')
+        for i in range(size)
+    ]
+    no_cache = url_cache.validation_cache(enabled=False)
+    results = []
+    result = measure(lambda: results.extend(validation.validate_urls(urls, max_workers=max_workers, cache=no_cache)))
+    result['valid'] = sum(1 for item in results if item['valid'] and item['status'] == 200)
+    return result
+
+def bench_rendering(urls:list[str], repeat:int) -> dict:
+    return measure(lambda: main.render_group(urls), repeat)
+
+def bench_create_group_file(urls:list[str], folder:str, max_workers:int) -> dict:
+    # the cache is warmed first so only rendering, path resolution and writing are measured
+    validation.validate_urls(urls, max_workers=max_workers)
+    return measure(lambda: main.create_group_file(urls, destination=folder, file_name='Benchmark group', overwrite=True, max_workers=max_workers))
+
+def bench_load_group_urls(urls:list[str], folder:str, repeat:int) -> dict:
+    path = folder + '/Parsed group.html'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(main.render_group(urls))
+    return measure(lambda: main.load_group_urls(path), repeat)
+
+def bench_new_file_name(size:int, folder:str) -> dict:
+    """
+    Fills a folder with size files sharing a base name, then measures allocating the next one.
+    """
+    folder = folder + f'/names {size}'
+    os.mkdir(folder)
+    for i in range(size):
+        name = 'New file' if i == 0 else f'New file {i + 1}'
+        with open(f'{folder}/{name}.html', 'w') as f:
+            f.write('')
+    first = measure(lambda: main.new_file_name(folder, 'html'))
+    repeated = measure(lambda: main.new_file_name(folder, 'html'), repeat=5)
+    return {'first': first, 'repeated': repeated}
+
+def bench_load_data(size:int, folder:str, repeat:int) -> dict:
+    path = folder + f'/URLs {size}.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({f'Label {i}': f'https://example.com/page/{i}' for i in range(size)}, f, indent=4)
+    return measure(lambda: main.load_data(path), repeat)
+
+def best_run_time(command:list[str], folder:str, repeat:int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=folder, capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def import_profile(module:str) -> dict:
+    """
+    Imports module in a new interpreter with -X importtime and returns its cumulative
+    import time, its slowest imports and the heavy modules it loaded.
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SOURCE_FOLDER, capture_output=True, text=True, check=True
+    )
+    imports = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        imports[name.strip()] = {'self': int(own) / 1e6, 'cumulative': int(cumulative) / 1e6}
+    slowest = sorted(imports, key=lambda name: imports[name]['self'], reverse=True)[:10]
+    return {
+        'cumulative': imports.get(module, {}).get('cumulative'),
+        'slowest': {name: imports[name]['self'] for name in slowest},
+        'heavy_modules': [name for name in HEAVY_MODULES if name in imports]
+    }
+
+def bench_startup(repeat:int = 10) -> dict:
+    """
+    Measures how long quick CLI commands take from the start of the interpreter to
+    their exit, compared to an interpreter that does nothing.
+    """
+    cli = os.path.join(SOURCE_FOLDER, 'CLI.py')
+    # installed copies run from cached bytecode, without it (PYTHONDONTWRITEBYTECODE,
+    # a fresh checkout) every start would also compile the modules
+    compileall.compile_dir(SOURCE_FOLDER, maxlevels=0, quiet=1)
+    with tempfile.TemporaryDirectory() as folder:
+        os.mkdir(folder + '/tabs')
+        with open(folder + '/config.json', 'w', encoding='utf-8') as f:
+            json.dump({'config': {}, 'default_config': {'path': 'URLs.json', 'tab_folder': 'tabs'}}, f)
+        with open(folder + '/tabs/Group.html', 'w', encoding='utf-8') as f:
+            f.write(main.render_group([f'https://example.com/page/{i}' for i in range(100)]))
+        scripts = {'print': 'print\n', 'open': 'open Group\nprint\n'}
+        for name, text in scripts.items():
+            with open(f'{folder}/{name}.txt', 'w', encoding='utf-8') as f:
+                f.write(text)
+
+        interpreter = best_run_time([sys.executable, '-c', 'pass'], folder, repeat)
+        report = {'interpreter': interpreter, 'target': STARTUP_TARGET, 'commands': {}}
+        for name in scripts:
+            total = best_run_time([sys.executable, cli, '--script', f'{name}.txt'], folder, repeat)
+            report['commands'][name] = {'total': total, 'overhead': total - interpreter}
+    report['met'] = all(command['overhead'] <= STARTUP_TARGET for command in report['commands'].values())
+    report['imports'] = import_profile('CLI')
+    return report
+
+def run(
+    sizes:list[int] = DEFAULT_SIZES,
+    network_limit:int = NETWORK_SIZE_LIMIT,
+    latency:float = 0.0,
+    max_workers:int = validation.MAX_WORKERS,
+    repeat:int = 3
+) -> dict:
+    """
+    Runs every benchmark for each dataset size and returns the results as a dictionary.
+    Sizes above network_limit skip the benchmarks that go through the HTTP server.
+    """
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency': latency,
+        'max_workers': max_workers,
+        'results': {}
+    }
+    with stand_in_server(latency=latency) as server, tempfile.TemporaryDirectory() as folder:
+        url_cache.set_shared_cache(url_cache.validation_cache(path=folder + '/cache.json'))
+        # the stand-in server is a single host, only retries are measured
+        scheduler.set_shared_settings(dict(scheduler.default_settings, requests_per_second=0, backoff_base=0.01))
+        try:
+            for size in sizes:
+                print(f'Running benchmarks with {size} URLs...')
+                urls = synthetic_urls(server.base_url, size)
+                results = {
+                    'render_group': bench_rendering(urls, repeat),
+                    'load_group_urls': bench_load_group_urls(urls, folder, repeat),
+                    'new_file_name': bench_new_file_name(size, folder),
+                    'load_data': bench_load_data(size, folder, repeat)
+                }
+                if size <= network_limit:
+                    results['validate_urls'] = bench_validation(urls, max_workers)
+                    results['create_group_file'] = bench_create_group_file(urls, folder, max_workers)
+                    results['validate_throttled'] = bench_throttled(server.base_url, size, max_workers)
+                report['results'][str(size)] = results
+                manifest.forget_manifests()
+        finally:
+            url_cache.set_shared_cache(None)
+            scheduler.set_shared_settings(None)
+            manifest.forget_manifests()
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures Tab-saver against a local stand-in HTTP server.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--network-limit', type=int, default=NETWORK_SIZE_LIMIT,
+                        help='largest size sent through the HTTP server')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the server waits before answering')
+    parser.add_argument('--workers', type=int, default=validation.MAX_WORKERS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark results.json')
+    parser.add_argument('--startup', action='store_true',
+                        help='only measures the start time of quick CLI commands')
+    args = parser.parse_args()
+
+    if args.startup:
+        report = bench_startup(max(args.repeat, 10))
+        for name, command in report['commands'].items():
+            print(f"{name}: {command['overhead'] * 1000:.0f} ms over the interpreter start (target {STARTUP_TARGET * 1000:.0f} ms)")
+        if report['imports']['heavy_modules']:
+            print(f"heavy modules imported at startup: {', '.join(report['imports']['heavy_modules'])}")
+    else:
+        report = run(args.sizes, args.network_limit, args.latency, args.workers, args.repeat)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f'Results written to {args.output}')
+    if args.startup and not report['met']:
+        sys.exit('startup target missed')
\ No newline at end of file
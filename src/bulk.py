@@ -0,0 +1,126 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from os import mkdir
+from os.path import exists
+from typing import Optional
+import main
+import manifest
+import rendering
+import validation
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500 # files written between two saves of the manifest
+
+def print_progress(done:int, total:int, end:str = ''):
+    print(f'\r{done}/{total} entries processed', end=end, flush=True)
+
+def write_file(job:tuple):
+    path, text = job
+    rendering.write_atomic(path, text)
+
+def try_write_file(job:tuple) -> Optional[OSError]:
+    """
+    Writes a job like write_file, returning the error instead of raising it so one
+    failed file does not stop the rest of its batch.
+    """
+    try:
+        write_file(job)
+    except OSError as e:
+        return e
+    return None
+
+def valid_label(label:str) -> bool:
+    """
+    Returns whether a label can be used as a file name inside the destination folder.
+    """
+    separators = {'/', '\\', os.sep, os.altsep} - {None}
+    return label.strip() not in ('', '.', '..') and not any(separator in label for separator in separators)
+
+def generate_singles(
+    data:dict,
+    destination:str = 'Generated HTML files',
+    max_workers:int = validation.MAX_WORKERS,
+    batch_size:int = BATCH_SIZE,
+    refresh:bool = False
+) -> dict:
+    """
+    Creates one single tab file per label of data ({label: url}).
+
+    Every URL is validated at once through the concurrent validator, names are
+    allocated from the folder manifest (a single listing of the folder) and files
+    are written by a worker pool in batches. Prints a single progress line and
+    returns a summary dictionary with the counts of created, duplicated, invalid
+    and failed entries; labels that are not file names and files that could not
+    be written are failed, their names are released for a later run.
+    """
+    if not exists(destination):
+        mkdir(destination)
+        logger.info(f'New directory \"{destination}\" has been created.')
+    index = manifest.open_manifest(destination)
+
+    known_hashes = index.hash_index()
+
+    def already_saved(label, url_hash):
+        # a file for this label may have been renamed with a suffix in a previous run
+        for file_name in known_hashes.get(url_hash, []):
+            stem = file_name.rsplit('.', 1)[0]
+            if stem == label or manifest.split_suffix(stem)[0] == label:
+                return True
+        return False
+
+    summary = {'created': 0, 'duplicated': 0, 'invalid': 0, 'failed': 0}
+    labels = []
+    for label in data:
+        if valid_label(label):
+            labels.append(label)
+        else:
+            summary['failed'] += 1
+            logger.warning(f'warning, label is not a valid file name, not added: {label!r}')
+    results = validation.validate_urls(
+        [data[label] for label in labels], max_workers=max_workers, refresh=refresh
+    )
+    invalid = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start in range(0, len(labels), batch_size):
+            batch = []
+            for label, result in zip(labels[start:start + batch_size], results[start:start + batch_size]):
+                url = result['url']
+                if not result['valid']:
+                    summary['invalid'] += 1
+                    invalid.append(url)
+                    continue
+                url_hash = manifest.url_set_hash([url])
+                file_name = label
+                if already_saved(label, url_hash):
+                    summary['duplicated'] += 1
+                    continue
+                if index.contains(file_name + '.html'):
+                    if main.same_urls(destination, file_name + '.html', [url]):
+                        summary['duplicated'] += 1
+                        continue
+                    file_name = index.new_file_name(label, 'html')
+                index.reserve(file_name + '.html', url_hash)
+                batch.append((file_name + '.html', url_hash, main.render_single(url)))
+
+            jobs = [(destination + '/' + file_name, text) for file_name, url_hash, text in batch]
+            for (file_name, url_hash, text), error in zip(batch, executor.map(try_write_file, jobs)):
+                if error is not None:
+                    index.release(file_name)
+                    summary['failed'] += 1
+                    logger.warning(f"warning, '{file_name}' could not be written: {error}")
+                    continue
+                index.record(file_name, None, url_hash=url_hash, save=False)
+                summary['created'] += 1
+            index.save()
+            print_progress(min(start + batch_size, len(labels)), len(labels))
+
+    print_progress(len(labels), len(labels), end='\n')
+    logger.info(f"{summary['created']} files created, {summary['duplicated']} already existed, {summary['invalid']} invalid URLs skipped, {summary['failed']} failed.")
+    for url in invalid[:10]:
+        logger.warning(f'warning, invalid url not added: {url}')
+    if len(invalid) > 10:
+        logger.warning(f'... and {len(invalid) - 10} more invalid URLs')
+    return summary
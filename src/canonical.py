@@ -0,0 +1,149 @@
+import re
+from typing import Iterable, Optional
+from urllib.parse import urlsplit, urlunsplit
+import configuration
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+default_settings = {
+    "enabled": True,
+    "strip_parameters": [ # query parameters removed from URLs, '*' matches any characters
+        "utm_*", "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid",
+        "mc_cid", "mc_eid", "igshid", "_ga", "_gl", "ref_src"
+    ],
+    "merge_schemes": True, # http:// and https:// versions of a URL are the same URL
+    "trailing_slash": True, # '/a/' and '/a' are the same path
+    "sort_query": True, # the order of the query parameters does not matter
+    "ignore_fragment": False # '#section' parts do not make a URL different
+}
+
+class url_canonicalizer:
+    """
+    Normalizes URLs with the rules of the 'canonical' section of config.json.
+
+    url() returns the form that is stored, validated and opened: lowercase scheme and
+    host, no default port, no tracking parameters. key() goes further and returns a
+    form only used to compare URLs, where the http and https versions, trailing
+    slashes and the order of the parameters can be ignored.
+    """
+    def __init__(self, settings:Optional[dict] = None):
+        import fnmatch # deferred, only needed to compile the stripped parameters once
+        self.settings = dict(default_settings, **(settings or {}))
+        patterns = '|'.join(fnmatch.translate(name) for name in self.settings['strip_parameters'])
+        self.stripped = re.compile(patterns) if patterns else None
+
+    def split(self, url:str):
+        """
+        Returns the parts of the normalized URL, or None if it is not an http(s) URL.
+        """
+        try:
+            parts = urlsplit(url.strip())
+            port = parts.port
+        except ValueError:
+            return None
+        if parts.scheme not in DEFAULT_PORTS or not parts.hostname:
+            return None
+
+        host = parts.hostname
+        if ':' in host: # IPv6 address
+            host = f'[{host}]'
+        if port is not None and port != DEFAULT_PORTS[parts.scheme]:
+            host += f':{port}'
+        if '@' in parts.netloc:
+            host = parts.netloc.rsplit('@', 1)[0] + '@' + host
+
+        query = parts.query
+        if query and self.stripped:
+            query = '&'.join(
+                parameter for parameter in query.split('&')
+                if parameter and not self.stripped.match(parameter.split('=', 1)[0])
+            )
+        return parts.scheme, host, parts.path or '/', query, parts.fragment
+
+    def url(self, url:str) -> str:
+        if not self.settings['enabled']:
+            return url
+        parts = self.split(url)
+        return urlunsplit(parts) if parts else url
+
+    def key(self, url:str) -> str:
+        if not self.settings['enabled']:
+            return url
+        parts = self.split(url)
+        if not parts:
+            return url
+        scheme, host, path, query, fragment = parts
+        if self.settings['merge_schemes']:
+            scheme = 'https'
+        if self.settings['trailing_slash']:
+            path = path.rstrip('/') or '/'
+        if self.settings['sort_query'] and query:
+            query = '&'.join(sorted(query.split('&')))
+        if self.settings['ignore_fragment']:
+            fragment = ''
+        return urlunsplit((scheme, host, path, query, fragment))
+
+_shared_canonicalizer = None
+
+def shared_canonicalizer() -> url_canonicalizer:
+    """
+    Returns the canonicalizer configured in the 'canonical' section of config.json.
+    """
+    global _shared_canonicalizer
+    if _shared_canonicalizer is None:
+        _shared_canonicalizer = url_canonicalizer(configuration.config_section('canonical', default_settings))
+    return _shared_canonicalizer
+
+def canonical_url(url:str) -> str:
+    return shared_canonicalizer().url(url)
+
+def url_key(url:str) -> str:
+    return shared_canonicalizer().key(url)
+
+class canonical_index:
+    """
+    Hash index from the canonical key of URLs to a value, like the label a URL was
+    staged with. Equivalent URLs share a single entry.
+    """
+    def __init__(self, items:Iterable[tuple[str, object]] = (), canonicalizer:Optional[url_canonicalizer] = None):
+        self.canonicalizer = canonicalizer or shared_canonicalizer()
+        self.entries = {}
+        for url, value in items:
+            self.add(url, value)
+
+    def get(self, url:str, default = None):
+        return self.entries.get(self.canonicalizer.key(url), default)
+
+    def add(self, url:str, value = None) -> bool:
+        """
+        Adds url with a value, the URL itself by default. Returns False without
+        changing anything if an equivalent URL is already in the index.
+        """
+        key = self.canonicalizer.key(url)
+        if key in self.entries:
+            return False
+        self.entries[key] = url if value is None else value
+        return True
+
+    def remove(self, url:str):
+        self.entries.pop(self.canonicalizer.key(url), None)
+
+    def __contains__(self, url:str) -> bool:
+        return self.canonicalizer.key(url) in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+def dedupe(urls:Iterable[str]) -> list[str]:
+    """
+    Returns the canonical form of urls without equivalent URLs, in their original
+    order. The first of a set of equivalent URLs is kept.
+    """
+    canonicalizer = shared_canonicalizer()
+    index = canonical_index(canonicalizer=canonicalizer)
+    unique_urls = []
+    for url in urls:
+        url = canonicalizer.url(url)
+        if index.add(url):
+            unique_urls.append(url)
+    return unique_urls
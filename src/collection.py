@@ -0,0 +1,323 @@
+import re
+from array import array
+from collections.abc import ItemsView, MutableMapping, Set, ValuesView
+from typing import Callable, Iterable, Iterator, Optional
+
+EMPTY = -1 # table position never used
+DELETED = -2 # table position of a removed entry, probing goes on past it
+REMOVED = 0xFFFFFFFF # host id of a removed entry
+SAME_AS_URL = -1 # label size of an entry whose label is its URL, like the entries of group files
+COMPACT_MIN_GARBAGE = 1 << 16 # bytes of removed entries before the buffer is rewritten
+
+prefix_pattern = re.compile(r'[a-zA-Z][a-zA-Z0-9+.-]*://[^/?#]*')
+
+def split_prefix(url:str) -> tuple[str, str]:
+    """
+    Splits a URL after its scheme and host: ('https://example.com', '/page?q=1').
+    """
+    match = prefix_pattern.match(url)
+    end = match.end() if match else 0
+    return url[:end], url[end:]
+
+class slot_table:
+    """
+    Open addressing hash table from hashes to entry slots, with linear probing.
+    Each position keeps a slot and the low 32 bits of its hash, which rule out
+    most other slots before match() compares the entries. Several slots can share
+    a hash; find() takes a function telling whether a slot is the one looked for.
+    """
+    __slots__ = ('slots', 'hashes', 'mask', 'used', 'filled', 'limit')
+
+    def __init__(self, capacity:int = 8):
+        self.slots = array('i', [EMPTY]) * capacity
+        self.hashes = array('I', [0]) * capacity
+        self.mask = capacity - 1
+        self.used = 0 # live positions
+        self.filled = 0 # live and deleted positions
+        self.limit = capacity * 2 // 3 # filled positions before the table grows
+
+    def find(self, hash_value:int, match:Callable[[int], bool]) -> int:
+        """
+        Returns the position of the first slot with hash_value accepted by match, or -1.
+        """
+        slots, hashes, mask = self.slots, self.hashes, self.mask
+        fingerprint = hash_value & 0xFFFFFFFF
+        position = hash_value & mask
+        while True:
+            slot = slots[position]
+            if slot == EMPTY:
+                return -1
+            if slot >= 0 and hashes[position] == fingerprint and match(slot):
+                return position
+            position = (position + 1) & mask
+
+    def find_all(self, hash_value:int, match:Callable[[int], bool]) -> Iterator[int]:
+        """
+        Yields the position of every slot with hash_value accepted by match.
+        """
+        slots, hashes, mask = self.slots, self.hashes, self.mask
+        fingerprint = hash_value & 0xFFFFFFFF
+        position = hash_value & mask
+        while slots[position] != EMPTY:
+            if slots[position] >= 0 and hashes[position] == fingerprint and match(slots[position]):
+                yield position
+            position = (position + 1) & mask
+
+    def insert(self, hash_value:int, slot:int):
+        if self.filled >= self.limit:
+            self.resize(1 << ((self.used + 1) * 3 // 2).bit_length()) # keeps the load between 1/3 and 2/3
+        slots, mask = self.slots, self.mask
+        position = hash_value & mask
+        while slots[position] >= 0:
+            position = (position + 1) & mask
+        if slots[position] == EMPTY:
+            self.filled += 1
+        slots[position] = slot
+        self.hashes[position] = hash_value & 0xFFFFFFFF
+        self.used += 1
+
+    def delete(self, position:int):
+        self.slots[position] = DELETED
+        self.used -= 1
+
+    def resize(self, capacity:int):
+        slots, hashes, mask = array('i', [EMPTY]) * capacity, array('I', [0]) * capacity, capacity - 1
+        for old_position, slot in enumerate(self.slots):
+            if slot >= 0:
+                fingerprint = self.hashes[old_position]
+                # the position only depends on the low bits, which the fingerprint keeps
+                position = fingerprint & mask
+                while slots[position] != EMPTY:
+                    position = (position + 1) & mask
+                slots[position] = slot
+                hashes[position] = fingerprint
+        self.slots, self.hashes, self.mask = slots, hashes, mask
+        self.filled = self.used
+        self.limit = capacity * 2 // 3
+
+class url_view(Set):
+    """
+    Set of the URLs of a collection, membership is tested through its URL table.
+    """
+    __slots__ = ('collection',)
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return set(iterable)
+
+    def __contains__(self, url) -> bool:
+        return isinstance(url, str) and next(self.collection.url_slots(url), None) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for label, url in self.collection.iter_items():
+            yield url
+
+    def __len__(self) -> int:
+        return len(self.collection)
+
+class collection_items(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+class collection_values(ValuesView):
+    def __iter__(self):
+        for label, url in self._mapping.iter_items():
+            yield url
+
+class url_collection(MutableMapping):
+    """
+    Compact {label: url} mapping for sessions with millions of entries.
+
+    The scheme and host of every URL are interned in a host table, the rest of
+    the URL and the label are stored as UTF-8 in one shared buffer, and each entry
+    is a few integers in typed arrays, so no string object is kept per entry.
+    Labels and URLs are found in O(1) through two open addressing tables of
+    hashes; URLs are compared by key(url), like canonical.url_key, so equivalent
+    URLs are found too. Entries keep their insertion order, a label given a new
+    URL keeps its place.
+    """
+    __slots__ = (
+        'key', 'hosts', 'host_ids', 'entry_hosts', 'starts', 'path_sizes', 'label_sizes',
+        'buffer', 'garbage', 'count', 'labels', 'urls_table'
+    )
+
+    def __init__(self, items:Iterable = (), key:Optional[Callable[[str], str]] = None):
+        self.key = key
+        self.hosts = [] # host id -> 'scheme://host'
+        self.host_ids = {} # 'scheme://host' -> host id
+        self.entry_hosts = array('I') # slot -> host id, REMOVED for removed entries
+        self.starts = array('Q') # slot -> offset of the path and label in buffer
+        self.path_sizes = array('I')
+        self.label_sizes = array('i') # SAME_AS_URL when the label is the URL
+        self.buffer = bytearray()
+        self.garbage = 0 # bytes of buffer no entry uses anymore
+        self.count = 0
+        self.labels = slot_table()
+        self.urls_table = slot_table()
+        self.update(items)
+
+    @classmethod
+    def from_urls(cls, urls:Iterable[str], key:Optional[Callable[[str], str]] = None) -> 'url_collection':
+        """
+        Returns a collection where each URL is its own label, like the URLs of a group
+        file, without storing the label twice.
+        """
+        collection = cls(key=key)
+        for url in urls:
+            if url not in collection:
+                collection[url] = url
+        return collection
+
+    def url_hash(self, url:str) -> int:
+        return hash(self.key(url) if self.key else url)
+
+    def url_at(self, slot:int) -> str:
+        start = self.starts[slot]
+        return self.hosts[self.entry_hosts[slot]] + self.buffer[start:start + self.path_sizes[slot]].decode('utf-8')
+
+    def label_at(self, slot:int) -> str:
+        size = self.label_sizes[slot]
+        if size == SAME_AS_URL:
+            return self.url_at(slot)
+        start = self.starts[slot] + self.path_sizes[slot]
+        return self.buffer[start:start + size].decode('utf-8')
+
+    def find_label(self, label:str) -> int:
+        return self.labels.find(hash(label), lambda slot: self.label_at(slot) == label)
+
+    def find_url(self, url:str, slot:int) -> int:
+        """
+        Returns the URL table position of the entry at slot, whose URL is url.
+        """
+        return self.urls_table.find(self.url_hash(url), lambda candidate: candidate == slot)
+
+    def url_slots(self, url:str) -> Iterator[int]:
+        """
+        Yields the slots of the entries whose URL is equivalent to url.
+        """
+        if self.key is None:
+            match = lambda candidate: self.url_at(candidate) == url
+        else:
+            key = self.key(url)
+            match = lambda candidate: self.key(self.url_at(candidate)) == key
+        for position in self.urls_table.find_all(self.url_hash(url), match):
+            yield self.urls_table.slots[position]
+
+    def store(self, label:str, url:str) -> tuple[int, int, int, int]:
+        """
+        Appends the path of url and label to the buffer, returns (host id, start, path size, label size).
+        """
+        host, path = split_prefix(url)
+        host_id = self.host_ids.get(host)
+        if host_id is None:
+            host_id = self.host_ids[host] = len(self.hosts)
+            self.hosts.append(host)
+        start = len(self.buffer)
+        path_bytes = path.encode('utf-8')
+        self.buffer += path_bytes
+        if label == url:
+            return host_id, start, len(path_bytes), SAME_AS_URL
+        label_bytes = label.encode('utf-8')
+        self.buffer += label_bytes
+        return host_id, start, len(path_bytes), len(label_bytes)
+
+    def entry_size(self, slot:int) -> int:
+        return self.path_sizes[slot] + max(0, self.label_sizes[slot])
+
+    def __getitem__(self, label:str) -> str:
+        position = self.find_label(label) if isinstance(label, str) else -1
+        if position == -1:
+            raise KeyError(label)
+        return self.url_at(self.labels.slots[position])
+
+    def __setitem__(self, label:str, url:str):
+        position = self.find_label(label)
+        if position == -1:
+            slot = len(self.entry_hosts)
+            host_id, start, path_size, label_size = self.store(label, url)
+            self.entry_hosts.append(host_id)
+            self.starts.append(start)
+            self.path_sizes.append(path_size)
+            self.label_sizes.append(label_size)
+            self.labels.insert(hash(label), slot)
+            self.count += 1
+        else:
+            slot = self.labels.slots[position]
+            old_url = self.url_at(slot)
+            if old_url == url:
+                return
+            self.urls_table.delete(self.find_url(old_url, slot))
+            self.garbage += self.entry_size(slot)
+            self.entry_hosts[slot], self.starts[slot], self.path_sizes[slot], self.label_sizes[slot] = self.store(label, url)
+        self.urls_table.insert(self.url_hash(url), slot)
+
+    def __delitem__(self, label:str):
+        position = self.find_label(label) if isinstance(label, str) else -1
+        if position == -1:
+            raise KeyError(label)
+        slot = self.labels.slots[position]
+        self.urls_table.delete(self.find_url(self.url_at(slot), slot))
+        self.labels.delete(position)
+        self.garbage += self.entry_size(slot)
+        self.entry_hosts[slot] = REMOVED
+        self.count -= 1
+        if self.garbage > COMPACT_MIN_GARBAGE and self.garbage > len(self.buffer) // 2:
+            self.compact()
+
+    def __contains__(self, label) -> bool:
+        return isinstance(label, str) and self.find_label(label) != -1
+
+    def __iter__(self) -> Iterator[str]:
+        for label, url in self.iter_items():
+            yield label
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __repr__(self) -> str:
+        return repr(dict(self.iter_items()))
+
+    def iter_items(self) -> Iterator[tuple[str, str]]:
+        entry_hosts = self.entry_hosts
+        for slot in range(len(entry_hosts)):
+            if entry_hosts[slot] != REMOVED:
+                url = self.url_at(slot)
+                yield (url if self.label_sizes[slot] == SAME_AS_URL else self.label_at(slot)), url
+
+    def items(self) -> collection_items:
+        return collection_items(self)
+
+    def values(self) -> collection_values:
+        return collection_values(self)
+
+    def urls(self) -> url_view:
+        return url_view(self)
+
+    def label_of(self, url:str) -> Optional[str]:
+        """
+        Returns the label of the first entry whose URL is equivalent to url, or None.
+        """
+        slot = min(self.url_slots(url), default=None) # the table order changes as positions are reused
+        return None if slot is None else self.label_at(slot)
+
+    def copy(self) -> 'url_collection':
+        return url_collection(self.iter_items(), key=self.key)
+
+    def compact(self):
+        """
+        Rewrites the buffer and the tables without the removed entries.
+        """
+        compacted = self.copy()
+        for name in self.__slots__:
+            setattr(self, name, getattr(compacted, name))
+
+    def nbytes(self) -> int:
+        """
+        Returns the approximate memory used by the entries, without the host table.
+        """
+        arrays = (self.entry_hosts, self.starts, self.path_sizes, self.label_sizes)
+        tables = (self.labels.slots, self.labels.hashes, self.urls_table.slots, self.urls_table.hashes)
+        return len(self.buffer) + sum(len(values) * values.itemsize for values in arrays + tables)
@@ -0,0 +1,47 @@
+import json
+import logging
+from os.path import exists
+
+logger = logging.getLogger(__name__)
+
+def merge_config(default:dict, custom:dict) -> dict:
+    """
+    Returns a copy of default updated with custom, merging nested sections key by key.
+    """
+    merged = dict(default)
+    for key, value in custom.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def load_config(file_path:str = 'config.json') -> dict:
+    """
+    Reads the config file and returns its 'config' section completed with the
+    values of 'default_config'. Returns an empty dictionary if the file does not exist.
+    """
+    if not exists(file_path):
+        logger.warning(f"Warning: config file not found at '{file_path}', using defaults.")
+        return {}
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = json.loads(f.read())
+
+    return merge_config(content.get('default_config', {}), content.get('config', {}))
+
+def config_section(name:str, defaults:dict, file_path:str = 'config.json') -> dict:
+    """
+    Returns a section of the config as a dictionary, using defaults for missing keys.
+    """
+    return merge_config(defaults, load_config(file_path).get(name, {}))
+
+def setup_logging(config:dict = None):
+    """
+    Sends the messages of every module to the terminal, at the level set by
+    'log_level' in config.json (INFO by default, DEBUG shows every URL check).
+    """
+    config = load_config() if config is None else config
+    level = getattr(logging, str(config.get('log_level', 'INFO')).upper(), logging.INFO)
+    logging.basicConfig(level=level, format='%(message)s')
+    logging.getLogger('urllib3').setLevel(max(level, logging.ERROR)) # retries are reported in the results
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import main
+import rendering
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = '.folder_scan.json'
+CACHE_VERSION = 1
+MAX_WORKERS = min(16, (os.cpu_count() or 1) + 4) # files parsed at the same time
+SCANNED_EXTENSIONS = ('.html', '.zip')
+
+def parse_file(path:str) -> dict:
+    """
+    Reads a generated file and returns its kind ('group', 'sharded', 'single',
+    'archive' or 'unknown') and URLs. The entries of archives also have their labels.
+    """
+    if path.endswith('.zip'):
+        import packing # zipfile is only needed for packed outputs
+        entries = list(packing.open_archive(path).entries())
+        return {'kind': 'archive', 'urls': [url for label, url in entries], 'labels': [label for label, url in entries]}
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    data = main.parse_data_block(content)
+    is_single = b'http-equiv="refresh"' in content
+    if data is not None and 'shards' in data:
+        return {'kind': 'sharded', 'urls': main.load_group_url_list(path, ignore_not_found=True) or [], 'parts': len(data['shards'])}
+    if data is not None:
+        return {'kind': 'single' if is_single else 'group', 'urls': data['urls']}
+
+    # files written before the data block existed
+    text = content.decode('utf-8', errors='replace')
+    if is_single:
+        url = main.read_single_url(text)
+        return {'kind': 'single', 'urls': [url] if url else []}
+    urls = list(main.read_group_urls(text))
+    return {'kind': 'group' if urls else 'unknown', 'urls': urls}
+
+class folder_scan:
+    """
+    Parsed contents of the generated files of a tab folder.
+
+    Each file is stored with the mtime and size it was read at in a JSON cache
+    inside the folder, so a scan lists the folder once and only parses the files
+    that are new or changed, in a worker pool.
+    """
+    def __init__(self, folder:str, max_workers:int = MAX_WORKERS):
+        self.folder = folder
+        self.path = os.path.join(folder, CACHE_NAME)
+        self.max_workers = max_workers
+        self.entries = {} # file name -> {'mtime', 'size', 'kind', 'urls', ...}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        content = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Warning: the scan cache of '{self.folder}' could not be read and will be rebuilt: {e}")
+        if content and content.get('version') == CACHE_VERSION:
+            self.entries = content.get('files', {})
+
+    def save(self):
+        if not self.changed or not os.path.isdir(self.folder):
+            return
+        with rendering.atomic_file(self.path) as f:
+            json.dump({'version': CACHE_VERSION, 'files': self.entries}, f, ensure_ascii=False)
+        self.changed = False
+
+    def parse(self, item:tuple[str, str, os.stat_result]) -> tuple[str, dict]:
+        name, path, stat = item
+        try:
+            entry = parse_file(path)
+        except Exception as e:
+            logger.warning(f"Warning: '{path}' could not be read: {e}")
+            entry = {'kind': 'unknown', 'urls': []}
+        entry.update(mtime=stat.st_mtime, size=stat.st_size)
+        return name, entry
+
+    def refresh(self) -> dict:
+        """
+        Brings the cache up to date with a single listing of the folder. Returns the
+        counts of parsed, removed and unchanged files.
+        """
+        summary = {'parsed': 0, 'removed': 0, 'unchanged': 0}
+        if not os.path.isdir(self.folder):
+            return summary
+        listed = set()
+        to_parse = []
+        with os.scandir(self.folder) as files:
+            for file in files:
+                if not file.name.endswith(SCANNED_EXTENSIONS) or file.name.startswith('.') or not file.is_file():
+                    continue
+                listed.add(file.name)
+                stat = file.stat()
+                known = self.entries.get(file.name)
+                if known and known['mtime'] == stat.st_mtime and known['size'] == stat.st_size:
+                    summary['unchanged'] += 1
+                else:
+                    to_parse.append((file.name, file.path, stat))
+
+        if to_parse:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for name, entry in executor.map(self.parse, to_parse):
+                    self.entries[name] = entry
+            summary['parsed'] = len(to_parse)
+            self.changed = True
+        for name in set(self.entries) - listed:
+            del self.entries[name]
+            summary['removed'] += 1
+            self.changed = True
+        self.save()
+        return summary
+
+_scans = {}
+
+def open_scan(folder:str) -> folder_scan:
+    """
+    Returns the scan of a tab folder, loading its cache the first time it is requested.
+    """
+    key = os.path.abspath(folder)
+    if key not in _scans:
+        _scans[key] = folder_scan(folder)
+    return _scans[key]
+
+def scan(folder:str) -> dict:
+    """
+    Returns the up to date {file name: entry} contents of a tab folder (see folder_scan).
+    """
+    start = time.perf_counter()
+    current = open_scan(folder)
+    summary = current.refresh()
+    logger.debug(f"'{folder}' scanned in {time.perf_counter() - start:.3f}s: {summary}")
+    return current.entries
@@ -0,0 +1,95 @@
+import threading
+from typing import TYPE_CHECKING
+import configuration
+
+if TYPE_CHECKING:
+    import requests
+
+# requests is imported by the functions that use it: it takes longer to import
+# than the rest of the program, and commands that check no URL never need it
+
+default_settings = {
+    "pool_connections": 100, # number of hosts that keep a connection pool
+    "pool_size": 10, # connections kept alive per host
+    "retries": 0, # retries that block a worker, validation.validate_urls reschedules failed URLs itself
+    "backoff_factor": 0.5, # waits backoff_factor * 2 ** (retry - 1) seconds between retries
+    "retry_statuses": [],
+    "user_agent": "Tab-saver link checker",
+    "max_drain_bytes": 1048576 # body read after a GET fallback so its connection is reused, larger bodies close it
+}
+
+# status codes some servers answer to HEAD requests even when a GET would work
+HEAD_REJECTED_STATUSES = {400, 403, 405, 501}
+
+_session = None
+_settings = None
+_session_lock = threading.Lock()
+
+def make_session(settings:dict = default_settings) -> 'requests.Session':
+    """
+    Creates a requests session with keep-alive connection pools and a retry policy.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=settings['retries'],
+        backoff_factor=settings['backoff_factor'],
+        status_forcelist=settings['retry_statuses'],
+        allowed_methods=frozenset(['HEAD', 'GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings['pool_connections'],
+        pool_maxsize=settings['pool_size'],
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = settings['user_agent']
+    return session
+
+def shared_session() -> 'requests.Session':
+    """
+    Returns the session shared by every validator, configured by the 'http' section
+    of config.json.
+    """
+    global _session, _settings
+    with _session_lock:
+        if _session is None:
+            _settings = configuration.config_section('http', default_settings)
+            _session = make_session(_settings)
+    return _session
+
+def release(response:'requests.Response', max_drain_bytes:int):
+    """
+    Reads the rest of a streamed body, up to max_drain_bytes, so its connection goes
+    back to the pool. Larger bodies close the connection instead of being downloaded.
+    """
+    import requests
+    drained = 0
+    try:
+        for chunk in response.iter_content(65536):
+            drained += len(chunk)
+            if drained > max_drain_bytes:
+                break
+    except requests.RequestException:
+        pass # the status is known, a body cut short only loses the connection
+    response.close()
+
+def request_url(url:str, timeout:float = 5) -> 'requests.Response':
+    """
+    Checks a URL with a HEAD request through the shared session, following redirects.
+    If the server rejects HEAD the URL is requested again with a streamed GET,
+    whose body is drained (see release) once its headers are read.
+    """
+    session = shared_session()
+    response = session.head(url, timeout=timeout, allow_redirects=True)
+    if response.status_code in HEAD_REJECTED_STATUSES:
+        response.close()
+        response = session.get(url, timeout=timeout, allow_redirects=True, stream=True)
+        release(response, _settings['max_drain_bytes'])
+    return response
@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import re
+from html.parser import HTMLParser
+from typing import Iterator, Optional
+from os.path import exists
+import storage
+import canonical
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 5000 # entries merged into the data between two progress reports
+URL_KEYS = ('url', 'uri') # Chrome and session exports use 'url', Firefox backups use 'uri'
+TITLE_KEYS = ('name', 'title')
+
+json_token = re.compile(
+    r'\s*(?:"(?P<string>(?:[^"\\]|\\.)*)"|(?P<punctuation>[{}\[\]:,])|(?P<literal>[^\s{}\[\]:,"]+))',
+    re.DOTALL
+)
+
+def read_chunks(file, chunk_size:int = CHUNK_SIZE) -> Iterator[str]:
+    while chunk := file.read(chunk_size):
+        yield chunk
+
+def iter_json_bookmarks(file) -> Iterator[tuple[Optional[str], str]]:
+    """
+    Streams (title, url) pairs out of a Chrome or Firefox bookmark JSON file, or any
+    JSON export where bookmarks are objects with a 'url' or 'uri' field (like session
+    exports). Only the string fields of the objects currently open are kept in
+    memory, so the size of the file does not matter.
+    """
+    stack = [] # one entry per open object ({'fields', 'key', 'expect_key'}) or array (None)
+    buffer = ''
+    final = False
+    chunks = read_chunks(file)
+    while not final:
+        chunk = next(chunks, None)
+        final = chunk is None
+        buffer += chunk or ''
+        position = 0
+        while True:
+            match = json_token.match(buffer, position)
+            # a token touching the end of the buffer may continue in the next chunk
+            if not match or (match.end() == len(buffer) and not final):
+                break
+            position = match.end()
+            top = stack[-1] if stack else None
+            punctuation = match.group('punctuation')
+            if punctuation == '{':
+                stack.append({'fields': {}, 'key': None, 'expect_key': True})
+            elif punctuation == '[':
+                stack.append(None)
+            elif punctuation in ('}', ']'):
+                closed = stack.pop() if stack else None
+                if closed is not None:
+                    url = next((closed['fields'][key] for key in URL_KEYS if key in closed['fields']), None)
+                    if url:
+                        title = next((closed['fields'][key] for key in TITLE_KEYS if closed['fields'].get(key)), None)
+                        yield title, url
+                if stack and stack[-1] is not None:
+                    stack[-1]['key'] = None
+            elif punctuation == ',':
+                if top is not None:
+                    top['expect_key'] = True
+            elif punctuation == ':':
+                if top is not None:
+                    top['expect_key'] = False
+            elif match.group('string') is not None and top is not None:
+                text = json.loads('"' + match.group('string') + '"')
+                if top['expect_key']:
+                    top['key'] = text
+                elif top['key'] is not None:
+                    top['fields'][top['key']] = text
+                    top['key'] = None
+            elif top is not None:
+                top['key'] = None # numbers, booleans and null are not needed
+        buffer = buffer[position:]
+        if final and buffer.strip():
+            logger.warning(f'Warning: the JSON input ended in the middle of a value, {len(buffer)} characters ignored.')
+
+class netscape_bookmark_parser(HTMLParser):
+    """
+    Incremental parser for the Netscape bookmark HTML format exported by browsers.
+    Collects (title, url) pairs of the <A HREF> tags as the input is fed.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.entries = []
+        self.href = None
+        self.title = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self.href = dict(attrs).get('href')
+            self.title = []
+
+    def handle_data(self, data):
+        if self.href is not None:
+            self.title.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self.href is not None:
+            self.entries.append((''.join(self.title).strip() or None, self.href))
+            self.href = None
+
+def iter_html_bookmarks(file) -> Iterator[tuple[Optional[str], str]]:
+    """
+    Streams (title, url) pairs out of a Netscape bookmark HTML file.
+    """
+    parser = netscape_bookmark_parser()
+    for chunk in read_chunks(file):
+        parser.feed(chunk)
+        yield from parser.entries
+        parser.entries = []
+    parser.close()
+    yield from parser.entries
+
+def iter_url_list(file) -> Iterator[tuple[Optional[str], str]]:
+    """
+    Streams (title, url) pairs out of a plain text file with one URL per line.
+    Lines can also use the syntax of the add command ('<url> as <label>'), empty
+    lines and lines starting with '#' are ignored.
+    """
+    add_syntax = re.compile(r'^(?P<url>\S+)\s+as\s+(?P<label>.+)')
+    for line in file:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if match := add_syntax.match(line):
+            yield match.group('label').strip(), match.group('url')
+        else:
+            yield None, line.split()[0]
+
+readers = {
+    'json': iter_json_bookmarks,
+    'html': iter_html_bookmarks,
+    'list': iter_url_list
+}
+
+def detect_format(file_path:str) -> str:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.json':
+        return 'json'
+    if extension in ('.html', '.htm'):
+        return 'html'
+    return 'list'
+
+def iter_entries(file_path:str, file_format:Optional[str] = None) -> Iterator[tuple[Optional[str], str]]:
+    """
+    Streams (title, url) pairs from a bookmark or URL list file. The format is
+    guessed from the extension unless file_format ('json', 'html' or 'list') is given.
+    """
+    file_format = file_format or detect_format(file_path)
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        yield from readers[file_format](f)
+
+def merge_entries(entries, data:dict, batch_size:int = BATCH_SIZE, on_batch = None) -> dict:
+    """
+    Adds (title, url) pairs to data ({label: url}) in their canonical form, skipping
+    URLs equivalent to one already in it and giving a numeric suffix to labels that
+    are already used.
+    on_batch is called with every batch of new entries before it is merged.
+    Returns a summary with the counts of read, added and duplicated entries.
+    """
+    seen_urls = canonical.canonical_index((url, label) for label, url in data.items())
+    next_suffix = {}
+    summary = {'read': 0, 'added': 0, 'duplicated': 0}
+    batch = {}
+
+    def flush():
+        if on_batch:
+            on_batch(batch)
+        data.update(batch)
+        summary['added'] += len(batch)
+        batch.clear()
+
+    for title, url in entries:
+        summary['read'] += 1
+        url = canonical.canonical_url(url)
+        if not url.startswith(('http://', 'https://')) or not seen_urls.add(url):
+            summary['duplicated'] += 1
+            continue
+
+        label = title or url
+        if label in data or label in batch:
+            n = next_suffix.get(label, 2)
+            while f'{label} {n}' in data or f'{label} {n}' in batch:
+                n += 1
+            next_suffix[label] = n + 1
+            label = f'{label} {n}'
+        batch[label] = url
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return summary
+
+def import_file(source:str, data_path:str = 'URLs.json', file_format:Optional[str] = None, on_progress = None) -> dict:
+    """
+    Imports the bookmarks or URLs of source into the data file at data_path.
+    on_progress is called with the size of the collection after every batch.
+    """
+    if not exists(source):
+        logger.error(f"Error: File not found at '{source}'")
+        return {'read': 0, 'added': 0, 'duplicated': 0}
+
+    store = storage.open_store(data_path)
+    data = store.load() or {}
+
+    def write_batch(batch):
+        store.upsert_many(batch)
+        if on_progress:
+            on_progress(len(data) + len(batch))
+        logger.debug(f'{len(data) + len(batch)} entries in the collection')
+
+    summary = merge_entries(iter_entries(source, file_format), data, on_batch=write_batch)
+    store.commit()
+    logger.info(f"{summary['added']} entries imported from '{source}', {summary['duplicated']} duplicated or unsupported entries skipped.")
+    return summary
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+from os import mkdir
+from os.path import exists
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+import bulk
+import canonical
+import main
+import manifest
+import rendering
+import validation
+
+logger = logging.getLogger(__name__)
+
+BUILD_MANIFEST_NAME = '.build_manifest.json'
+
+def template_version() -> str:
+    """
+    Returns a short hash of the HTML templates in use, builtin or set in config.json,
+    so outputs rendered with an older template are rebuilt.
+    """
+    import sharding # registers the templates of sharded groups
+    return hashlib.sha256(rendering.template_sources().encode('utf-8')).hexdigest()[:12]
+
+def load_build_manifest(destination:str) -> dict:
+    path = destination + '/' + BUILD_MANIFEST_NAME
+    if not exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('entries', {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"Warning: the build manifest of '{destination}' could not be read, every entry will be rebuilt: {e}")
+        return {}
+
+def save_build_manifest(destination:str, entries:dict):
+    """
+    Replaces the build manifest atomically.
+    """
+    with rendering.atomic_file(destination + '/' + BUILD_MANIFEST_NAME) as f:
+        json.dump({'entries': entries}, f)
+
+def read_text(path:str) -> Optional[str]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def remove_output(destination:str, file_name:str, index:manifest.folder_manifest):
+    try:
+        os.remove(destination + '/' + file_name)
+    except FileNotFoundError:
+        pass
+    index.forget(file_name, save=False)
+
+def print_report(report:dict):
+    logger.info(
+        f"{report['added']} added, {report['changed']} changed, {report['skipped']} skipped, "
+        f"{report['deleted']} deleted, {report['invalid']} invalid."
+    )
+
+def build_singles(
+    data:dict,
+    destination:str = 'Generated HTML files',
+    max_workers:int = validation.MAX_WORKERS,
+    refresh:bool = False,
+    only:Optional[Iterable[str]] = None
+) -> dict:
+    """
+    Incrementally builds one single tab file per label of data ({label: url}).
+
+    Labels whose URL and template did not change since the last build are skipped
+    without validating or writing anything, files of labels that left data are
+    deleted. Files of labels without an entry that already open their URL, like
+    the output of a bulk build, are adopted rather than written again under a
+    numbered name. If only is given, just those labels are looked at, which is what
+    the watch mode does with the labels it saw change. Returns a report with the
+    counts of added, changed, skipped, deleted and invalid entries.
+    """
+    if not exists(destination):
+        mkdir(destination)
+        logger.info(f'New directory \"{destination}\" has been created.')
+    index = manifest.open_manifest(destination)
+    entries = load_build_manifest(destination)
+    version = template_version()
+    report = {'added': 0, 'changed': 0, 'skipped': 0, 'deleted': 0, 'invalid': 0}
+
+    labels = data.keys() if only is None else [label for label in only if label in data]
+    to_build = [] # (key, label, url, url_hash)
+    adopted = {} # key -> file of a label without entry that already opens its URL
+    for label in labels:
+        url = data[label]
+        key = 'single:' + label
+        url_hash = manifest.url_set_hash([url])
+        entry = entries.get(key)
+        if entry and entry['hash'] == url_hash and entry['template'] == version and index.contains(entry['file']):
+            report['skipped'] += 1
+            continue
+        file_name = label + '.html'
+        if entry is None and index.contains(file_name) and main.same_urls(destination, file_name, [url]):
+            # written by a build that kept no entries, like a bulk build: adopted instead of duplicated
+            if read_text(destination + '/' + file_name) == main.render_single(url):
+                entries[key] = {'hash': url_hash, 'template': version, 'file': file_name}
+                report['skipped'] += 1
+                continue
+            adopted[key] = file_name # rendered with another template, rewritten in place
+        to_build.append((key, label, url, url_hash))
+
+    candidates = entries if only is None else ['single:' + label for label in only if 'single:' + label in entries]
+    for key in [key for key in candidates if key.startswith('single:') and key[len('single:'):] not in data]:
+        remove_output(destination, entries.pop(key)['file'], index)
+        report['deleted'] += 1
+
+    results = validation.validate_urls([url for key, label, url, url_hash in to_build], max_workers=max_workers, refresh=refresh)
+    jobs = []
+    for (key, label, url, url_hash), result in zip(to_build, results):
+        previous = entries.get(key)
+        if not result['valid']:
+            report['invalid'] += 1
+            if previous:
+                # the URL of the label changed to one that does not work, its old file is stale
+                remove_output(destination, entries.pop(key)['file'], index)
+                report['deleted'] += 1
+            logger.warning(f'warning, invalid url not added: {url}')
+            continue
+        file_name = previous['file'] if previous else adopted.get(key)
+        if file_name is None:
+            file_name = label + '.html'
+            if index.contains(file_name):
+                file_name = index.new_file_name(label, 'html') + '.html'
+            index.reserve(file_name, url_hash)
+        report['changed' if previous or key in adopted else 'added'] += 1
+        entries[key] = {'hash': url_hash, 'template': version, 'file': file_name}
+        jobs.append((file_name, url_hash, main.render_single(url)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(bulk.write_file, [(destination + '/' + file_name, text) for file_name, url_hash, text in jobs]))
+    for file_name, url_hash, text in jobs:
+        index.record(file_name, None, url_hash=url_hash, save=False)
+
+    index.save()
+    save_build_manifest(destination, entries)
+    print_report(report)
+    return report
+
+def build_group(
+    url_list:list[str],
+    destination:str = 'Generated HTML files',
+    file_name:str = 'New file',
+    max_workers:int = validation.MAX_WORKERS,
+    refresh:bool = False
+) -> dict:
+    """
+    Incrementally builds a group file, skipping it if its URL set and template did
+    not change since the last build. Returns the same kind of report as build_singles.
+    """
+    if not exists(destination):
+        mkdir(destination)
+        logger.info(f'New directory \"{destination}\" has been created.')
+    index = manifest.open_manifest(destination)
+    entries = load_build_manifest(destination)
+    version = template_version()
+    report = {'added': 0, 'changed': 0, 'skipped': 0, 'deleted': 0, 'invalid': 0}
+
+    key = 'group:' + file_name
+    url_hash = manifest.url_set_hash(url_list)
+    entry = entries.get(key)
+    if entry and entry['hash'] == url_hash and entry['template'] == version and index.contains(entry['file']):
+        report['skipped'] += 1
+    else:
+        accepted_urls = main.accepted_group_urls(url_list, max_workers=max_workers, refresh=refresh)
+        # equivalent URLs merged by accepted_group_urls are not invalid
+        report['invalid'] += len(canonical.dedupe(url_list)) - len(accepted_urls)
+        main.write_group(destination + '/' + file_name + '.html', accepted_urls)
+        report['changed' if entry else 'added'] += 1
+        entries[key] = {'hash': url_hash, 'template': version, 'file': file_name + '.html'}
+        save_build_manifest(destination, entries)
+
+    print_report(report)
+    return report
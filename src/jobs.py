@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+import validation
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 2 # jobs running at the same time, the rest wait in the queue
+PREVALIDATION_DELAY = 0.5 # seconds staged URLs are collected before validating them together
+
+class job:
+    """
+    Background operation started from the CLI. The function it runs receives the
+    job itself, to report progress and check if it was cancelled.
+    """
+    def __init__(self, job_id:int, name:str):
+        self.id = job_id
+        self.name = name
+        self.status = 'queued'
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def progress(self, done:int, total:Optional[int] = None):
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def describe(self) -> str:
+        progress = f'{self.done}/{self.total}' if self.total else str(self.done)
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0
+        line = f'[{self.id}] {self.name}: {self.status}, {progress} done, {elapsed:.1f}s'
+        if self.error:
+            line += f', error: {self.error}'
+        return line
+
+class job_manager:
+    """
+    Runs jobs in a small thread pool so the prompt stays available while they work.
+    """
+    def __init__(self, max_jobs:int = MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.pool = None # created by the first job, most CLI runs never start one
+        self.jobs = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.prevalidation_queue = []
+        self.prevalidation_timer = None
+
+    @property
+    def executor(self):
+        with self.lock:
+            if self.pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self.pool = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix='job')
+            return self.pool
+
+    def submit(self, name:str, function:Callable, *args, **kwargs) -> job:
+        """
+        Queues function(job, *args, **kwargs) and returns its job.
+        """
+        with self.lock:
+            new_job = job(self.next_id, name)
+            self.jobs[new_job.id] = new_job
+            self.next_id += 1
+        new_job.future = self.executor.submit(self.run, new_job, function, args, kwargs)
+        return new_job
+
+    def run(self, current:job, function:Callable, args, kwargs):
+        if current.cancelled:
+            current.status = 'cancelled'
+            return
+        current.status = 'running'
+        current.started = time.time()
+        try:
+            current.result = function(current, *args, **kwargs)
+            current.status = 'cancelled' if current.cancelled else 'done'
+        except validation.validation_cancelled:
+            current.status = 'cancelled'
+        except Exception as e:
+            current.status = 'failed'
+            current.error = f'{type(e).__name__}: {e}'
+        current.finished = time.time()
+        print(f'\n{current.describe()}')
+
+    def get(self, job_id) -> Optional[job]:
+        try:
+            return self.jobs.get(int(job_id))
+        except (TypeError, ValueError):
+            return None
+
+    def active(self) -> list[job]:
+        return [current for current in self.jobs.values() if current.status in ('queued', 'running')]
+
+    def cancel(self, job_id) -> bool:
+        current = self.get(job_id)
+        if current is None or current.status not in ('queued', 'running'):
+            return False
+        current.cancel_event.set()
+        return True
+
+    def wait(self, job_id = None, timeout:Optional[float] = None):
+        """
+        Blocks until a job, or every active job if no id is given, has finished.
+        """
+        waiting = [self.get(job_id)] if job_id is not None else self.active()
+        for current in waiting:
+            if current is not None and current.future is not None:
+                current.future.exception(timeout=timeout)
+
+    def prevalidate(self, urls:list[str]):
+        """
+        Validates staged URLs in the background so a later save finds them in the
+        validation cache. URLs staged close together are validated in one batch.
+        """
+        with self.lock:
+            self.prevalidation_queue.extend(urls)
+            if self.prevalidation_timer is None:
+                self.prevalidation_timer = threading.Timer(PREVALIDATION_DELAY, self.flush_prevalidation)
+                self.prevalidation_timer.daemon = True
+                self.prevalidation_timer.start()
+
+    def flush_prevalidation(self):
+        with self.lock:
+            urls, self.prevalidation_queue = self.prevalidation_queue, []
+            self.prevalidation_timer = None
+        if urls:
+            self.executor.submit(quiet_validation, urls)
+
+    def shutdown(self, wait:bool = True):
+        with self.lock:
+            timer = self.prevalidation_timer
+        if timer is not None:
+            timer.cancel()
+            self.flush_prevalidation()
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=not wait)
+
+def quiet_validation(urls:list[str]):
+    try:
+        validation.validate_urls(urls)
+    except Exception as e:
+        logger.debug(f'Background validation failed: {e}')
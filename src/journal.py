@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import threading
+from os.path import exists
+from typing import Callable, Optional
+import configuration
+import rendering
+import storage
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "compact_bytes": 1048576, # journal size that starts a background compaction
+    "fsync": True, # flush every change to the disk before returning
+    "session_path": "CLI session" # base path of the snapshot and journal of src/CLI.py
+}
+
+def empty_state() -> dict:
+    return {'urls': {}, 'meta': {}}
+
+def apply_operation(state:dict, operation:dict):
+    """
+    Applies one journal operation to a state ({'urls': {label: url}, 'meta': {}}).
+    """
+    match operation.get('op'):
+        case 'add':
+            state['urls'][operation['label']] = operation['url']
+        case 'remove':
+            state['urls'].pop(operation['label'], None)
+        case 'rename':
+            if operation['label'] in state['urls']:
+                state['urls'][operation['new_label']] = state['urls'].pop(operation['label'])
+        case 'reset':
+            state['urls'] = dict(operation['urls'])
+        case 'meta':
+            state['meta'][operation['key']] = operation['value']
+        case _:
+            logger.warning(f"Warning: unknown journal operation ignored: {operation}")
+
+def replay_file(state:dict, file_path:str) -> int:
+    """
+    Applies every operation of a journal file to state and returns how many were applied.
+    A last line cut by a crash is ignored.
+    """
+    if not exists(file_path):
+        return 0
+    applied = 0
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                operation = json.loads(line)
+            except ValueError:
+                logger.warning(f"Warning: incomplete line at the end of '{file_path}' ignored.")
+                break
+            apply_operation(state, operation)
+            applied += 1
+    return applied
+
+class staging_journal:
+    """
+    Append-only journal of staged changes on top of a snapshot.
+
+    Every change is one appended JSON line. recover() rebuilds the staged state by
+    replaying the journal over the snapshot, and once the journal passes
+    compact_bytes it is folded into the snapshot by a background thread.
+
+    load_snapshot() returns the state of the snapshot and fold(old_state, new_state)
+    writes new_state as the new snapshot.
+    """
+    def __init__(
+        self,
+        path:str,
+        load_snapshot:Callable[[], dict],
+        fold:Callable[[dict, dict], None],
+        compact_bytes:int = default_settings['compact_bytes'],
+        sync:bool = default_settings['fsync']
+    ):
+        self.path = path
+        self.compacting_path = path + '.compacting'
+        self.load_snapshot = load_snapshot
+        self.fold = fold
+        self.compact_bytes = compact_bytes
+        self.sync = sync
+        self.lock = threading.Lock()
+        self.compaction_lock = threading.Lock()
+        self.compaction = None
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def recover(self) -> dict:
+        """
+        Returns the snapshot with every journaled change applied, including the ones
+        of a compaction that was interrupted.
+        """
+        state = self.load_snapshot()
+        replayed = replay_file(state, self.compacting_path) + replay_file(state, self.path)
+        if replayed:
+            logger.info(f"{replayed} staged changes recovered from '{self.path}'")
+        return state
+
+    def append_many(self, operations:list[dict]):
+        """
+        Appends operations with a single write, then starts a compaction if the
+        journal got too big.
+        """
+        if not operations:
+            return
+        text = ''.join(json.dumps(operation, ensure_ascii=False) + '\n' for operation in operations)
+        with self.lock:
+            self.file.write(text)
+            self.file.flush()
+            if self.sync:
+                os.fsync(self.file.fileno())
+            size = self.file.tell()
+        if size >= self.compact_bytes:
+            self.compact(background=True)
+
+    def append(self, op:str, **fields):
+        self.append_many([dict(op=op, **fields)])
+
+    def rotate(self) -> bool:
+        """
+        Moves the current journal aside to be folded, new changes go to a fresh journal.
+        """
+        with self.lock:
+            if self.file.tell() == 0:
+                return False
+            self.file.close()
+            os.replace(self.path, self.compacting_path)
+            self.file = open(self.path, 'a', encoding='utf-8')
+            return True
+
+    def fold_compacting(self):
+        old_state = self.load_snapshot()
+        new_state = json.loads(json.dumps(old_state)) # deep copy
+        replay_file(new_state, self.compacting_path)
+        self.fold(old_state, new_state)
+        os.remove(self.compacting_path)
+
+    def run_compaction(self):
+        with self.compaction_lock:
+            if exists(self.compacting_path): # left by an interrupted compaction
+                self.fold_compacting()
+            if self.rotate():
+                self.fold_compacting()
+
+    def compact(self, background:bool = False):
+        """
+        Folds the journal into the snapshot. In background mode the work runs in a
+        thread and only one compaction runs at a time.
+        """
+        if not background:
+            self.wait()
+            self.run_compaction()
+            return
+        if self.compaction and self.compaction.is_alive():
+            return
+        self.compaction = threading.Thread(target=self.run_compaction, daemon=True)
+        self.compaction.start()
+
+    def wait(self):
+        if self.compaction:
+            self.compaction.join()
+
+    def close(self):
+        self.wait()
+        with self.lock:
+            self.file.close()
+
+def json_snapshot(path:str) -> tuple[Callable[[], dict], Callable[[dict, dict], None]]:
+    """
+    Returns load_snapshot and fold functions that keep the snapshot in a JSON file.
+    """
+    def load_snapshot():
+        if not exists(path):
+            return empty_state()
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return {'urls': state.get('urls', {}), 'meta': state.get('meta', {})}
+
+    def fold(old_state, new_state):
+        with rendering.atomic_file(path, sync=True) as f:
+            json.dump(new_state, f)
+
+    return load_snapshot, fold
+
+def store_snapshot(store) -> tuple[Callable[[], dict], Callable[[dict, dict], None]]:
+    """
+    Returns load_snapshot and fold functions that keep the snapshot in a data store,
+    writing only the entries that changed.
+    """
+    def load_snapshot():
+        return {'urls': store.load() or {}, 'meta': {}}
+
+    def fold(old_state, new_state):
+        storage.apply_changes(store, old_state['urls'], new_state['urls'])
+
+    return load_snapshot, fold
+
+def open_journal(path:str, load_snapshot, fold, settings:Optional[dict] = None) -> staging_journal:
+    """
+    Creates a journal with the settings of the 'journal' section of config.json.
+    """
+    settings = configuration.config_section('journal', default_settings) if settings is None else settings
+    return staging_journal(path, load_snapshot, fold, settings['compact_bytes'], settings['fsync'])
@@ -1,14 +1,25 @@
-import requests
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 from os.path import exists
 from os import mkdir, remove
 import re
 import json
+import logging
+import mmap
+import validation
+import manifest
+import metrics
+import canonical
+import storage
+import rendering
+import configuration
+
+logger = logging.getLogger(__name__)
 
 single_tab_html_template = """<!DOCTYPE html>
 <html>
 <head>
 <title>Open URL</title>
+<script type="application/json" id="tab-saver-data">{data}</script>
 <meta http-equiv="refresh" content="0; url={url}">
 </head>
 <body>
@@ -21,6 +32,7 @@ multi_tab_html_template_a = """<!DOCTYPE html>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Auto Tab Opener</title>
+    <script type="application/json" id="tab-saver-data">{data}</script>
 </head>
 <body>
     <!-- This minimal content is just to inform the user about pop-up blockers. -->
@@ -31,8 +43,8 @@ multi_tab_html_template_a = """<!DOCTYPE html>
     </div>
 
     <script>
-        // Define the URLs you want to open
-        const urlsToOpen = {urls};
+        // The URLs to open are read from the data block in the head
+        const urlsToOpen = JSON.parse(document.getElementById('tab-saver-data').textContent).urls;
         """
         
 multi_tab_html_template_b ="""
@@ -55,39 +67,108 @@ multi_tab_html_template_b ="""
 </body>
 </html>"""
 
+rendering.register_template('single', single_tab_html_template)
+rendering.register_template('group', multi_tab_html_template_a, multi_tab_html_template_b)
+
+DATA_FORMAT_VERSION = 2 # version of the JSON data block embedded in generated files, 2 added sharded groups
+DATA_BLOCK_START = b'<script type="application/json" id="tab-saver-data">'
+DATA_BLOCK_END = b'</script>'
+ARCHIVE_MEMBER_MARK = '.zip/' # in the path of an entry of a packed archive, 'folder/Tabs.zip/label.html'
+
+def iter_data_block(urls:Iterable[str], **fields) -> Iterator[str]:
+    """
+    Yields the JSON embedded in generated files one URL at a time, escaped so it
+    can not end the script element that contains it. fields are added to the data,
+    like the 'shards' of a sharded group launcher.
+    """
+    head = json.dumps(dict(fields, format=DATA_FORMAT_VERSION), ensure_ascii=False)
+    yield rendering.escape_script(head[:-1]) + ', "urls": ['
+    separator = ''
+    for url in urls:
+        yield separator + rendering.escape_script(json.dumps(url, ensure_ascii=False))
+        separator = ', '
+    yield ']}'
+
+def data_block(urls:Iterable[str], **fields) -> str:
+    return ''.join(iter_data_block(urls, **fields))
+
+def parse_data_block(content:bytes) -> Optional[dict]:
+    """
+    Finds and decodes the data block of a generated file. Returns None for files
+    written before the block existed.
+    """
+    start = content.find(DATA_BLOCK_START)
+    if start == -1:
+        return None
+    start += len(DATA_BLOCK_START)
+    end = content.find(DATA_BLOCK_END, start)
+    if end == -1:
+        return None
+    data = json.loads(bytes(content[start:end]).decode('utf-8'))
+    if data.get('format', 0) > DATA_FORMAT_VERSION:
+        logger.warning(f"Warning: data block format {data.get('format')} is newer than the supported {DATA_FORMAT_VERSION}.")
+    return data
+
+def load_data_block(file_path:str) -> Optional[dict]:
+    """
+    Reads only the data block of a generated file through a memory map, without
+    decoding or copying the rest of the document.
+    """
+    with metrics.timer('parsing'), open(file_path, 'rb') as f:
+        if f.seek(0, 2) == 0: # empty file
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            return parse_data_block(content)
+
+def load_archive_data_block(file_path:str, ignore_not_found:bool = False) -> Optional[dict]:
+    """
+    Reads the data block of an entry of a packed archive without unpacking it (see packing.py).
+    """
+    import packing # zipfile is only needed for packed outputs
+    data = packing.load_data_block(file_path)
+    if data is None and not ignore_not_found:
+        logger.error(f"Error: archive entry not found at '{file_path}'")
+    return data
+
 def valid_url(url:str) -> bool:
     """
     Checks if a URL exists and is accessible.
     Returns True if the URL returns a successful status code (2xx),
     False otherwise, including connection errors.
     """
-    try:
-        response = requests.head(url, timeout=5) # Add a timeout to prevent hanging
-        print(f"URL successfully read, status code:{response.status_code}")
-        return 200 <= response.status_code < 300
-    except requests.exceptions.RequestException as e:
-        # This catches various errors like ConnectionError, Timeout, TooManyRedirects, etc.
-        print(f"Error checking URL {url}: {e}")
-        return False
+    result = validation.check_url(url)
+    report_validation(result)
+    return result['valid']
+
+def report_validation(result:dict):
+    """
+    Logs the outcome of a URL check made by the validation module.
+    """
+    if result['cached']:
+        logger.debug(f"URL found in the validation cache, status code:{result['status']}")
+    elif result['error']:
+        logger.debug(f"Error checking URL {result['url']}: {result['error']}")
+    else:
+        logger.debug(f"URL successfully read, status code:{result['status']}")
 
 def new_file_name(directory:str, extension:str, default_name:str = 'New file'):
     """
     Given a base string and an extension, returns a string that represents a filename that is 
     not being used in the given directory. (so it can create a new file with a
     name that resembles the base string)
+    The names in use come from the folder manifest instead of probing the disk.
     """
-    
-    possible_file_name = default_name
-    possible_file_destination = directory + '/' + possible_file_name + '.' + extension
-    n = 2 #possible directory addition to avoid problems with the name 
-    while exists(possible_file_destination):
-        possible_file_name = default_name + f' {str(n)}'
-        possible_file_destination = directory + '/' + possible_file_name + extension
-        n += 1
-    print(exists(possible_file_destination), possible_file_destination)
+    with metrics.timer('path'):
+        possible_file_name = manifest.open_manifest(directory).new_file_name(default_name, extension)
+    logger.debug(f'File name available: {directory}/{possible_file_name}.{extension}')
     return possible_file_name
 
 def read_single_url(html_string:str):
+    data = parse_data_block(html_string.encode('utf-8'))
+    if data is not None and data['urls']:
+        return data['urls'][0]
+
+    # Files written before the data block existed
     # Regex to find the URL in the meta refresh tag
     # It looks for: <meta http-equiv="refresh" content="0; url=THE_URL_HERE">
     # It's flexible with whitespace and quotes (single or double) around 'url='
@@ -98,7 +179,7 @@ def read_single_url(html_string:str):
         url:str = match.group(1).strip()
         return url
     else:
-        print(f"Warning: No URL found in text with the expected format.")
+        logger.warning(f"Warning: No URL found in text with the expected format.")
         return None
 
 def load_single_url(file_path:str, ignore_not_found:bool = False):
@@ -111,18 +192,24 @@ def load_single_url(file_path:str, ignore_not_found:bool = False):
     Returns:
         str: The extracted URL if found, otherwise None.
     """
+    if ARCHIVE_MEMBER_MARK in file_path:
+        data = load_archive_data_block(file_path, ignore_not_found)
+        return data['urls'][0] if data and data['urls'] else None
     if not exists(file_path):
         if not ignore_not_found:
-            print(f"Error: File not found at '{file_path}'")
+            logger.error(f"Error: File not found at '{file_path}'")
         return None
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        data = load_data_block(file_path)
+        if data is not None:
+            return data['urls'][0] if data['urls'] else None
+        with metrics.timer('parsing'), open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
-        return read_single_url(content)
+            return read_single_url(content)
 
     except Exception as e:
-        print(f"An error occurred while reading or parsing '{file_path}': {e}")
+        logger.error(f"An error occurred while reading or parsing '{file_path}': {e}")
         return None
     
 def read_group_urls(html_string:str):
@@ -137,6 +224,11 @@ def read_group_urls(html_string:str):
               'urlsToOpen' array. Returns an empty list if no URLs are found
               or if the script structure is not as expected.
     """
+    data = parse_data_block(html_string.encode('utf-8'))
+    if data is not None:
+        return set(data['urls'])
+
+    # Files written before the data block existed
     urls = []
     script_match = re.search(r'<script>(.*?)</script>', html_string, re.DOTALL)
 
@@ -156,49 +248,144 @@ def read_group_urls(html_string:str):
                     urls.append(url)
     return set(urls)
 
-def load_group_urls(file_path:str, ignore_not_found:bool = False):
-    
+def load_group_url_list(file_path:str, ignore_not_found:bool = False) -> Optional[list[str]]:
+    """
+    Returns the URLs of a group file in the order they are opened. The URLs of a
+    sharded group are read from its parts, and entries of packed archives are read
+    from the archive.
+    """
+    if ARCHIVE_MEMBER_MARK in file_path:
+        data = load_archive_data_block(file_path, ignore_not_found)
+        return data['urls'] if data else None
     if not exists(file_path):
         if not ignore_not_found:
-            print(f"Error: File not found at '{file_path}'")
+            logger.error(f"Error: File not found at '{file_path}'")
         return None
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
+
+    data = load_data_block(file_path)
+    if data is not None and 'shards' in data:
+        urls = []
+        folder = file_path.rsplit('/', 1)[0] if '/' in file_path else '.'
+        for shard in data['shards']:
+            shard_data = load_data_block(folder + '/' + shard) if exists(folder + '/' + shard) else None
+            if shard_data is None:
+                logger.warning(f"Warning: part '{shard}' of '{file_path}' is missing, its URLs are skipped.")
+                continue
+            urls.extend(shard_data['urls'])
+        return urls
+    if data is not None:
+        return data['urls']
+
+    with metrics.timer('parsing'), open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
-            
-    url_list = read_group_urls(content)
+            return list(read_group_urls(content))
+
+def load_group_urls(file_path:str, ignore_not_found:bool = False):
+    
+    url_list = load_group_url_list(file_path, ignore_not_found)
+    if url_list is None:
+        return None
     
-    return url_list
+    return set(url_list)
 
-def group_text(url_list:list[str]):
+def accepted_group_urls(
+    url_list:list[str], 
+    max_workers:int = validation.MAX_WORKERS, 
+    refresh:bool = False, 
+    on_progress = None, 
+    cancel_event = None
+):
     """
-    Creates the text to be saved to a html file from a group of URLs
+    Validates a group of URLs concurrently and returns the ones that work, in their
+    original order. Equivalent URLs are merged first (see canonical.dedupe) and results
+    found in the validation cache are reused unless refresh is True.
+    on_progress and cancel_event are passed to validation.validate_urls.
     """
     accepted_urls = []
-    for url in url_list:
-        if valid_url(url):
-            accepted_urls.append(url)
+    url_list = list(url_list)
+    unique_urls = canonical.dedupe(url_list)
+    metrics.count('urls.merged', len(url_list) - len(unique_urls))
+    url_list = unique_urls
+    results = validation.validate_urls(
+        url_list, max_workers=max_workers, refresh=refresh, on_progress=on_progress, cancel_event=cancel_event
+    )
+    for result in results:
+        report_validation(result)
+        if result['valid']:
+            accepted_urls.append(result['url'])
         else:
-            print(f'warning, invalid url not added: {url}')
-    
-    text = multi_tab_html_template_a.format(urls=accepted_urls) + multi_tab_html_template_b
-    return text
+            logger.warning(f"warning, invalid url not added: {result['url']}")
+    metrics.count('urls.accepted', len(accepted_urls))
+    metrics.count('urls.rejected', len(results) - len(accepted_urls))
+    return accepted_urls
+
+def render_group(accepted_urls:list[str]):
+    """
+    Creates the text of a group file from URLs that were already validated.
+    """
+    return rendering.get_template('group').render(data=iter_data_block(accepted_urls))
+
+def group_text(url_list:list[str], max_workers:int = validation.MAX_WORKERS, refresh:bool = False):
+    """
+    Creates the text to be saved to a html file from a group of URLs.
+    The URLs are validated concurrently and keep their original order, results
+    found in the validation cache are reused unless refresh is True.
+    """
+    return render_group(accepted_group_urls(url_list, max_workers=max_workers, refresh=refresh))
+
+def file_urls(file_path:str) -> set:
+    """
+    Returns the set of URLs opened by a generated file, whether it is a group or a single file.
+    """
+    urls = load_group_urls(file_path, ignore_not_found = True)
+    if urls:
+        return urls
+    url = load_single_url(file_path, ignore_not_found = True)
+    return {url} if url else set()
+
+def same_urls(destination:str, file_name:str, url_list) -> bool:
+    """
+    Checks if a file of the destination folder already opens the given URLs, using
+    the hash stored in the folder manifest. Files the manifest has no hash for are
+    read once and their hash is stored. A file that does not exist opens no URLs.
+    """
+    index = manifest.open_manifest(destination)
+    stored_hash = index.stored_hash(file_name)
+    if stored_hash is None:
+        path = destination + '/' + file_name
+        if not exists(path): # deleted, or only reserved by a batch
+            return False
+        urls = file_urls(path)
+        try:
+            index.record(file_name, urls)
+        except FileNotFoundError: # deleted while it was read
+            return False
+        stored_hash = index.stored_hash(file_name)
+    return stored_hash == manifest.url_set_hash(url_list)
 
 def get_valid_path(
         destination:str = 'Generated HTML files', 
         file_name:Optional[str] = None, 
         extension:str = 'html', 
         default_name:str = 'New file',
-        url_list:Optional[str] = None,
+        url_list:Optional[list[str]] = None,
         overwrite = False
     ):
+    """
+    Returns the path where a file with the given URLs should be written, or None if
+    a file with that name already opens the same URLs.
+    """
     if not exists(destination):
             mkdir(destination)
-            print(f'New directory \"{destination}\" has been created.')
-            
-    if exists(destination + "/" + file_name + '.' + extension) or not file_name:
-        if set(load_group_urls(path, ignore_not_found = True)) == set(url_list):
-            print('The file you are trying to create already exists with its contents.')
+            logger.info(f'New directory \"{destination}\" has been created.')
+
+    if not file_name:
+        file_name = new_file_name(destination, extension, default_name)
+
+    index = manifest.open_manifest(destination)
+    if index.contains(file_name + '.' + extension):
+        if same_urls(destination, file_name + '.' + extension, url_list or []):
+            logger.info('The file you are trying to create already exists with its contents.')
             return None
         elif overwrite:
             pass # exits the if and filename stays the same
@@ -208,76 +395,111 @@ def get_valid_path(
     path = destination + "/" + file_name + '.' + extension
     return path
 
+def write_generated_file(path:str, content:Iterable[str], urls, save_manifest:bool = True):
+    """
+    Writes a generated file, given as its text or as a stream of chunks from a
+    template, atomically and records it in the manifest of its folder.
+    """
+    rendering.write_atomic(path, content)
+    metrics.count('files.written')
+    destination, file_name = path.rsplit('/', 1)
+    manifest.open_manifest(destination).record(file_name, urls, save=save_manifest)
+
+def write_group(path:str, accepted_urls:list[str], save_manifest:bool = True):
+    """
+    Writes a group file, as a launcher page with parts if the group is larger than
+    the threshold of the 'sharding' section of config.json (see sharding.write_sharded_group).
+    """
+    import sharding
+    if sharding.should_shard(len(accepted_urls)):
+        sharding.write_sharded_group(path, accepted_urls, save_manifest=save_manifest)
+    else:
+        content = rendering.get_template('group').stream(data=iter_data_block(accepted_urls))
+        write_generated_file(path, content, accepted_urls, save_manifest)
+        sharding.remove_parts(path)
+
 def create_group_file(
     url:list[str], 
     destination:str = 'Generated HTML files', 
     file_name:str = 'New file', 
-    overwrite = False
+    overwrite = False,
+    max_workers:int = validation.MAX_WORKERS,
+    refresh:bool = False,
+    on_progress = None,
+    cancel_event = None
 ):
     
-    text = group_text(url)
-    path = get_valid_path(
-        destination, 
-        file_name, 
-        default_name=file_name, 
-        url_list=url, 
-        overwrite=overwrite
+    accepted_urls = accepted_group_urls(
+        url, max_workers=max_workers, refresh=refresh, on_progress=on_progress, cancel_event=cancel_event
     )
+    with metrics.timer('path'):
+        path = get_valid_path(
+            destination, 
+            file_name, 
+            default_name=file_name, 
+            url_list=accepted_urls, 
+            overwrite=overwrite
+        )
     
     if path:
-        with open(path,'w') as f:
-            f.write(text)
-        print(f'new file created at \"{destination}\": {file_name}.html')
+        write_group(path, accepted_urls)
+        logger.info(f'new file created at \"{destination}\": {path.rsplit("/", 1)[1]}')
+
+def render_single(url:str):
+    """
+    Creates the text of a single tab file from a URL that was already validated.
+    """
+    import html # deferred, commands that render no single file start faster without it
+    return rendering.get_template('single').render(data=iter_data_block([url]), url=html.escape(url, quote=True))
 
-def single_text(url:str):
+def single_text(url:str, refresh:bool = False):
     """
     Creates the text to be saved to a html file from a single URL
     """
-    if valid_url(url):
-        text = single_tab_html_template.format(url=url)
+    result = validation.validate_urls([url], refresh=refresh)[0]
+    report_validation(result)
+    if result['valid']:
+        text = render_single(url)
         return text
     else:
-        print(f'warning, invalid url not added: {url}')
+        logger.warning(f'warning, invalid url not added: {url}')
     
-def create_single_file(url:str, destination:str = 'Generated HTML files', file_name:str = 'New file'):
+def create_single_file(
+    url:str, 
+    destination:str = 'Generated HTML files', 
+    file_name:str = 'New file', 
+    refresh:bool = False
+):
     """
     Creates a new html file that opens a set of tabs.
     """
-    text = single_text(url)
-    path = get_valid_path(destination, file_name, default_name=file_name, url_list=url)
+    text = single_text(url, refresh=refresh)
+    if not text:
+        return
+    with metrics.timer('path'):
+        path = get_valid_path(destination, file_name, default_name=file_name, url_list=[url])
     
     if path:
-        with open(path,'w') as f:
-            f.write(text)
-        print(f'new file created at \"{destination}\": {file_name}.html')
+        write_generated_file(path, text, [url])
+        logger.info(f'new file created at \"{destination}\": {path.rsplit("/", 1)[1]}')
 
-def load_data(file_path:str) -> Optional[dict]: 
+def load_collection(file_path:str):
     """
-    loads and returns a dictionary from a JSON file if possible, else return False.
+    Loads the data store into a compact collection (see collection.py), a page of
+    entries at a time, so a SQLite store is never held as a dictionary.
     """
+    import collection
+    urls = collection.url_collection()
+    for page in storage.open_store(file_path).iter_pages():
+        urls.update(page)
+    return urls
 
-    if not exists(file_path):
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump({}, f, indent=4)
-        print(f"New file created at '{file_path}'")
-        return {}
-    
-    # we try to read the file
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            if not content:
-                return {}
-    except Exception as e:
-        print(f"An unexpected error occurred while reading '{file_path}': {e}")
-        return False
-    
-    # we process the data into a dictionary.
-    data = json.loads(content)
-    if not isinstance(data, dict):
-        print(f"Warning: '{file_path}' must be a dictionary, try changing the file path.")
-    else:
-        return data
+def load_data(file_path:str) -> Optional[dict]: 
+    """
+    loads and returns a dictionary from the data store if possible, else return False.
+    The store backend (JSON file or SQLite database) is chosen in config.json.
+    """
+    return storage.open_store(file_path).load()
 
 def test():
     from os import rmdir
@@ -300,4 +522,5 @@ def test():
     
 
 if __name__ == '__main__':
+    configuration.setup_logging()
     test()
\ No newline at end of file
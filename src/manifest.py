@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Iterable, Optional
+import canonical
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.tab_manifest.json'
+MANIFEST_VERSION = 1
+
+def url_set_hash(urls:Iterable[str]) -> str:
+    """
+    Returns a hash that identifies a set of URLs regardless of their order or repetitions.
+    URLs are compared by their canonical key, so equivalent URLs give the same hash.
+    """
+    import hashlib # deferred, commands that compare no files start faster without it
+    if isinstance(urls, str):
+        urls = [urls]
+    digest = hashlib.sha256()
+    for url in sorted({canonical.url_key(url) for url in urls}):
+        digest.update(url.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def split_suffix(name:str) -> tuple[str, Optional[int]]:
+    """
+    Splits a name like 'New file 3' into ('New file', 3). Names without a numeric
+    suffix return (name, None).
+    """
+    match = re.fullmatch(r'(?P<base>.+) (?P<n>[0-9]+)', name)
+    if match:
+        return match.group('base'), int(match.group('n'))
+    return name, None
+
+class folder_manifest:
+    """
+    Index of the files generated in a tab folder, kept in a JSON file inside the folder.
+
+    For every file it stores the hash of its URL set, its mtime and its size, and for
+    every base name the next free numeric suffix, so duplicate detection and name
+    allocation are lookups instead of reading and probing the folder.
+    """
+    def __init__(self, folder:str):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.files = {} # file name -> {'hash', 'mtime', 'size'}
+        self.next_suffix = {} # 'base.extension' -> next numeric suffix to try
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        content = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Warning: the manifest of '{self.folder}' could not be read and will be rebuilt: {e}")
+
+        if content and content.get('version') == MANIFEST_VERSION:
+            # reservations are never saved, older manifests may still hold some
+            self.files = {name: entry for name, entry in content.get('files', {}).items() if entry['mtime'] is not None}
+            self.next_suffix = content.get('next_suffix', {})
+            # files added or removed by hand change the folder after the manifest was written
+            if os.stat(self.folder).st_mtime > os.stat(self.path).st_mtime + 1:
+                self.rescan()
+        elif os.path.isdir(self.folder):
+            self.rescan()
+
+    def rescan(self):
+        """
+        Synchronizes the manifest with a single listing of the folder. Entries of
+        files that changed lose their hash, which is computed again when needed.
+        """
+        with self.lock:
+            listed = {}
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    # dot files are indexes like this manifest, not generated files
+                    if entry.name.startswith('.') or entry.name.endswith('.tmp') or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    known = self.files.get(entry.name)
+                    if known and known['mtime'] == stat.st_mtime and known['size'] == stat.st_size:
+                        listed[entry.name] = known
+                    else:
+                        listed[entry.name] = {'hash': None, 'mtime': stat.st_mtime, 'size': stat.st_size}
+                    self.note_suffix(entry.name)
+            self.files = listed
+            self.save()
+
+    def save(self):
+        """
+        Writes the manifest to a temporary file and renames it over the old one, so
+        readers never see a partially written manifest.
+        """
+        with self.lock:
+            if not os.path.isdir(self.folder):
+                return
+            import tempfile # deferred, it is only needed to save
+            # reserved names only exist in this process until their file is recorded
+            files = {name: entry for name, entry in self.files.items() if entry['mtime'] is not None}
+            content = {'version': MANIFEST_VERSION, 'files': files, 'next_suffix': self.next_suffix}
+            # a unique dot file name, the CLI, background jobs and the generator may save at the same time
+            fd, temp_path = tempfile.mkstemp(prefix=MANIFEST_NAME + '.', suffix='.tmp', dir=self.folder)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(content, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+    def note_suffix(self, file_name:str):
+        stem, extension = os.path.splitext(file_name)
+        base, n = split_suffix(stem)
+        key = base + extension
+        if n is not None and self.next_suffix.get(key, 2) <= n:
+            self.next_suffix[key] = n + 1
+
+    def contains(self, file_name:str) -> bool:
+        """
+        Returns whether the name is taken. Known files are checked on disk once, their
+        entry is dropped if they were deleted; names reserved in a batch of this
+        process are taken until they are recorded or released.
+        """
+        with self.lock:
+            path = os.path.join(self.folder, file_name)
+            entry = self.files.get(file_name)
+            if entry is not None:
+                if entry['mtime'] is None or os.path.exists(path):
+                    return True
+                del self.files[file_name]
+                return False
+            if os.path.exists(path):
+                stat = os.stat(path)
+                self.files[file_name] = {'hash': None, 'mtime': stat.st_mtime, 'size': stat.st_size}
+                self.note_suffix(file_name)
+                return True
+            return False
+
+    def stored_hash(self, file_name:str) -> Optional[str]:
+        """
+        Returns the URL-set hash stored for a file, or None if it is unknown, only
+        reserved or changed on disk since it was recorded.
+        """
+        with self.lock:
+            entry = self.files.get(file_name)
+            if entry is None or entry['hash'] is None or entry['mtime'] is None:
+                return None
+            try:
+                stat = os.stat(os.path.join(self.folder, file_name))
+            except FileNotFoundError:
+                del self.files[file_name]
+                return None
+            if stat.st_mtime != entry['mtime'] or stat.st_size != entry['size']:
+                entry['hash'] = None
+                return None
+            return entry['hash']
+
+    def new_file_name(self, default_name:str, extension:str) -> str:
+        """
+        Returns default_name, or default_name followed by the next free numeric
+        suffix if a file with that name already exists.
+        """
+        with self.lock:
+            if not self.contains(default_name + '.' + extension):
+                return default_name
+            key = default_name + '.' + extension
+            n = self.next_suffix.get(key, 2)
+            while self.contains(f'{default_name} {n}.{extension}'):
+                n += 1
+            self.next_suffix[key] = n
+            return f'{default_name} {n}'
+
+    def record(self, file_name:str, urls:Iterable[str], url_hash:Optional[str] = None, save:bool = True):
+        """
+        Stores the URL-set hash, mtime and size of a file that was just written.
+        """
+        with self.lock:
+            stat = os.stat(os.path.join(self.folder, file_name))
+            self.files[file_name] = {
+                'hash': url_hash if url_hash is not None else url_set_hash(urls),
+                'mtime': stat.st_mtime,
+                'size': stat.st_size
+            }
+            self.note_suffix(file_name)
+            if save:
+                self.save()
+
+    def hash_index(self) -> dict:
+        """
+        Returns a dictionary from URL-set hash to the names of the files that have it.
+        """
+        with self.lock:
+            index = {}
+            for file_name, entry in self.files.items():
+                if entry['hash'] is not None and entry['mtime'] is not None:
+                    index.setdefault(entry['hash'], []).append(file_name)
+            return index
+
+    def reserve(self, file_name:str, url_hash:str):
+        """
+        Marks a name as used before its file is written, so names allocated in the
+        same batch do not collide. record must be called once the file exists, or
+        release if it could not be written.
+        """
+        with self.lock:
+            self.files[file_name] = {'hash': url_hash, 'mtime': None, 'size': None}
+            self.note_suffix(file_name)
+
+    def release(self, file_name:str):
+        """
+        Drops the reservation of a name whose file was not written.
+        """
+        with self.lock:
+            entry = self.files.get(file_name)
+            if entry is not None and entry['mtime'] is None:
+                del self.files[file_name]
+
+    def forget(self, file_name:str, save:bool = True):
+        with self.lock:
+            self.files.pop(file_name, None)
+            if save:
+                self.save()
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def open_manifest(folder:str) -> folder_manifest:
+    """
+    Returns the manifest of a folder, loading it the first time it is requested.
+    """
+    key = os.path.abspath(folder)
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = folder_manifest(folder)
+        return _manifests[key]
+
+def forget_manifests():
+    """
+    Drops the loaded manifests, they are read from their folders again on next use.
+    """
+    with _manifests_lock:
+        _manifests.clear()
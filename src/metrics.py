@@ -0,0 +1,129 @@
+import atexit
+import json
+import threading
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5] # upper bounds in seconds, plus one bucket for slower ones
+
+enabled = False
+_lock = threading.Lock()
+_counters = {}
+_stages = {} # stage -> {'calls', 'total', 'max'}
+_hosts = {} # host -> {'count', 'total', 'buckets'}
+_null_timer = nullcontext()
+
+def enable(value:bool = True):
+    """
+    Turns the collection of metrics on or off. While off every function of this
+    module returns immediately.
+    """
+    global enabled
+    enabled = value
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _stages.clear()
+        _hosts.clear()
+
+def count(name:str, amount:int = 1):
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+class stage_timer:
+    """
+    Context manager that adds the time spent inside it to a stage of the pipeline.
+    """
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage:str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            stats = _stages.setdefault(self.stage, {'calls': 0, 'total': 0.0, 'max': 0.0})
+            stats['calls'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+        return False
+
+def timer(stage:str):
+    """
+    Returns a context manager timing a stage ('validation', 'rendering', 'path',
+    'io', 'parsing', ...). Does nothing while metrics are disabled.
+    """
+    if not enabled:
+        return _null_timer
+    return stage_timer(stage)
+
+def observe_latency(host:str, seconds:float):
+    """
+    Adds a request latency to the histogram of its host.
+    """
+    if not enabled or seconds is None:
+        return
+    with _lock:
+        stats = _hosts.setdefault(host, {'count': 0, 'total': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1)})
+        stats['count'] += 1
+        stats['total'] += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][i] += 1
+                break
+        else:
+            stats['buckets'][-1] += 1
+
+def snapshot() -> dict:
+    """
+    Returns every metric collected so far as a JSON serializable dictionary.
+    """
+    with _lock:
+        hits = _counters.get('cache.hits', 0)
+        misses = _counters.get('cache.misses', 0)
+        return {
+            'enabled': enabled,
+            'counters': dict(_counters),
+            'cache_hit_rate': hits / (hits + misses) if hits + misses else None,
+            'stages': {
+                stage: dict(stats, mean=stats['total'] / stats['calls'])
+                for stage, stats in _stages.items()
+            },
+            'hosts': {
+                host: {
+                    'count': stats['count'],
+                    'mean': stats['total'] / stats['count'],
+                    'buckets': dict(zip([f'<={bound}s' for bound in LATENCY_BUCKETS] + ['slower'], stats['buckets']))
+                }
+                for host, stats in _hosts.items()
+            },
+            'latency_buckets': LATENCY_BUCKETS
+        }
+
+def dump(file_path:Optional[str] = None) -> str:
+    """
+    Returns the snapshot as JSON text, also writing it to file_path if given.
+    """
+    text = json.dumps(snapshot(), indent=4)
+    if file_path:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return text
+
+def setup(config:dict):
+    """
+    Enables metrics if the 'metrics' section of the config says so, and dumps them
+    to its 'output' file when the program exits.
+    """
+    settings = config.get('metrics', {})
+    enable(bool(settings.get('enabled')))
+    if enabled and settings.get('output'):
+        atexit.register(dump, settings['output'])
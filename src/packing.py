@@ -0,0 +1,248 @@
+import logging
+import os
+import shutil
+import warnings
+import zipfile
+import zlib
+from os import mkdir
+from os.path import exists
+from typing import Iterator, Optional
+import configuration
+import main
+import metrics
+import rendering
+import validation
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "archive_name": "Tabs.zip", # archive of the tab folder written by packed builds
+    "compression": "deflated", # 'deflated' or 'stored'
+    "compact_ratio": 0.5 # share of replaced or deleted entries that makes a build rewrite the archive
+}
+
+COMPRESSION = {'deflated': zipfile.ZIP_DEFLATED, 'stored': zipfile.ZIP_STORED}
+
+def split_archive_path(path:str) -> Optional[tuple[str, str]]:
+    """
+    Splits the path of an archive entry ('folder/Tabs.zip/label.html') into the
+    path of the archive and the name of the entry, or returns None for other paths.
+    """
+    archive_path, mark, name = path.partition(main.ARCHIVE_MEMBER_MARK)
+    if not mark or not name:
+        return None
+    return archive_path + mark[:-1], name
+
+class tab_archive:
+    """
+    Zip archive holding the single tab files of a folder, one entry per label.
+
+    The central directory of the archive is an index from entry names to their
+    offsets, so an entry is read without unpacking the others, and new entries are
+    appended without compressing the others again. An entry that is written again
+    shadows its older versions and an empty entry marks a deleted label; compact()
+    rewrites the archive without them. Like the other generated files, every
+    change is written to a copy that replaces the archive (see
+    rendering.atomic_file), so a crash never leaves it torn.
+    """
+    def __init__(self, path:str, settings:Optional[dict] = None):
+        self.path = path
+        self.settings = configuration.config_section('packing', default_settings) if settings is None else settings
+        self.members = {} # entry name -> ZipInfo of its latest version
+        self.total = 0 # versions of every entry, shadowed and deleted ones included
+        self.signature = None
+        self.zip = None
+        self.load()
+
+    def stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        self.close()
+        self.members = {}
+        self.total = 0
+        self.signature = self.stat_signature()
+        if self.signature is None:
+            return
+        try:
+            with metrics.timer('parsing'):
+                self.zip = zipfile.ZipFile(self.path, 'r')
+                infos = self.zip.infolist()
+        except zipfile.BadZipFile as e:
+            # moved aside, the next packed build writes every entry again
+            logger.warning(f"Warning: '{self.path}' is damaged and will be rebuilt, the old file is kept as '{self.path}.damaged': {e}")
+            os.replace(self.path, self.path + '.damaged')
+            self.signature = None
+            return
+        self.total = len(infos)
+        for info in infos: # later versions of a name come last
+            self.members[info.filename] = info
+
+    def refresh(self):
+        """
+        Reloads the index of the archive if it was written since it was loaded.
+        """
+        if self.stat_signature() != self.signature:
+            self.load()
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
+
+    def names(self) -> list[str]:
+        return [name for name, info in self.members.items() if info.file_size]
+
+    def __contains__(self, name:str) -> bool:
+        info = self.members.get(name)
+        return info is not None and info.file_size > 0
+
+    def crc(self, name:str) -> Optional[int]:
+        """
+        Returns the CRC-32 of an entry stored in the index, which tells whether a new
+        version differs from it without reading it.
+        """
+        return self.members[name].CRC if name in self else None
+
+    def read(self, name:str) -> Optional[bytes]:
+        if name not in self:
+            return None
+        with metrics.timer('io'):
+            return self.zip.read(self.members[name])
+
+    def entries(self) -> Iterator[tuple[str, str]]:
+        """
+        Yields the label and URL of every entry.
+        """
+        for name in self.names():
+            data = main.parse_data_block(self.read(name))
+            if data and data['urls']:
+                yield name[:-len('.html')] if name.endswith('.html') else name, data['urls'][0]
+
+    def dead_ratio(self) -> float:
+        return (self.total - len(self.names())) / self.total if self.total else 0.0
+
+    def append(self, entries:list[tuple[str, str]], removed:list[str] = ()):
+        """
+        Appends entries (name, text) and marks the removed names as deleted. The
+        stored entries are copied as they are, then the new ones are added to the copy.
+        """
+        if not entries and not removed:
+            return
+        self.close()
+        compression = COMPRESSION.get(self.settings['compression'], zipfile.ZIP_DEFLATED)
+        with metrics.timer('io'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning) # duplicate names are how entries are replaced
+            with rendering.atomic_file(self.path, mode='w+b') as f:
+                if exists(self.path):
+                    with open(self.path, 'rb') as old:
+                        shutil.copyfileobj(old, f, 1 << 20)
+                    f.seek(0)
+                with zipfile.ZipFile(f, 'a', compression=compression) as archive:
+                    for name, text in entries:
+                        archive.writestr(name, text)
+                    for name in removed:
+                        archive.writestr(name, b'')
+        metrics.count('files.written', len(entries))
+        self.load()
+
+    def compact(self):
+        """
+        Rewrites the archive with only the latest version of its live entries and
+        replaces the old one atomically.
+        """
+        names = self.names()
+        with metrics.timer('io'):
+            with rendering.atomic_file(self.path, mode='w+b') as f:
+                with zipfile.ZipFile(f, 'w') as archive:
+                    for name in names:
+                        info = self.members[name]
+                        archive.writestr(info, self.zip.read(info), compress_type=info.compress_type)
+                self.close() # the old archive is released before it is replaced
+        logger.debug(f"'{self.path}' compacted from {self.total} to {len(names)} entries")
+        self.load()
+
+_archives = {}
+
+def open_archive(path:str) -> tab_archive:
+    """
+    Returns the archive at path, reloading its index only when the file changed.
+    """
+    key = os.path.abspath(path)
+    if key not in _archives:
+        _archives[key] = tab_archive(path)
+    else:
+        _archives[key].refresh()
+    return _archives[key]
+
+def load_data_block(path:str) -> Optional[dict]:
+    """
+    Returns the data block of an archive entry given as 'folder/Tabs.zip/label.html',
+    or None if the archive or the entry does not exist.
+    """
+    archive_path, name = split_archive_path(path)
+    if not exists(archive_path):
+        return None
+    content = open_archive(archive_path).read(name)
+    return main.parse_data_block(content) if content else None
+
+def pack_singles(
+    data:dict,
+    destination:str = 'Generated HTML files',
+    archive_name:Optional[str] = None,
+    max_workers:int = validation.MAX_WORKERS,
+    refresh:bool = False
+) -> dict:
+    """
+    Writes one single tab entry per label of data ({label: url}) into the archive
+    of the destination folder instead of one file each.
+
+    Entries whose rendered text has the CRC stored in the archive are skipped
+    without validating their URL, the others are validated and appended, and the
+    entries of labels that left data or whose URL became invalid are deleted. The
+    archive is compacted once the share of shadowed and deleted entries reaches
+    compact_ratio. Returns a report with the counts of added, changed, skipped,
+    deleted and invalid entries.
+    """
+    settings = configuration.config_section('packing', default_settings)
+    if not exists(destination):
+        mkdir(destination)
+        logger.info(f'New directory \"{destination}\" has been created.')
+    archive = open_archive(destination + '/' + (archive_name or settings['archive_name']))
+    report = {'added': 0, 'changed': 0, 'skipped': 0, 'deleted': 0, 'invalid': 0}
+
+    to_build = [] # (name, url, text)
+    for label, url in data.items():
+        name = label + '.html'
+        text = main.render_single(url)
+        if archive.crc(name) == zlib.crc32(text.encode('utf-8')):
+            report['skipped'] += 1
+        else:
+            to_build.append((name, url, text))
+
+    results = validation.validate_urls([url for name, url, text in to_build], max_workers=max_workers, refresh=refresh)
+    entries = []
+    removed = [name for name in archive.names() if name[:-len('.html')] not in data]
+    for (name, url, text), result in zip(to_build, results):
+        if not result['valid']:
+            report['invalid'] += 1
+            if name in archive:
+                removed.append(name)
+            logger.warning(f'warning, invalid url not added: {url}')
+            continue
+        report['changed' if name in archive else 'added'] += 1
+        entries.append((name, text))
+    report['deleted'] = len(removed)
+
+    archive.append(entries, removed)
+    if archive.dead_ratio() >= settings['compact_ratio']:
+        archive.compact()
+    logger.info(
+        f"{report['added']} added, {report['changed']} changed, {report['skipped']} skipped, "
+        f"{report['deleted']} deleted, {report['invalid']} invalid entries in '{archive.path}'."
+    )
+    return report
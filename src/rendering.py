@@ -0,0 +1,146 @@
+import logging
+import os
+import string
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Union
+import configuration
+import metrics
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "fsync": True, # flush generated files to the disk before they replace the old version
+    "buffer_size": 65536, # bytes buffered before a write to the disk
+    "templates": {} # template name ('single', 'group', 'shard', 'launcher') -> path of a file replacing it
+}
+
+class template:
+    """
+    HTML template compiled once into its literal parts and fields.
+
+    source uses the str.format syntax ({data}, with literal braces doubled), suffix
+    is literal text appended to it, like the JavaScript halves of the templates of
+    main. Field values are strings or iterables of strings, which are streamed
+    without being joined, so a document is never held in memory as a whole.
+    """
+    def __init__(self, source:str, suffix:str = ''):
+        self.parts = [] # (literal, field name or None)
+        for literal, field, format_spec, conversion in string.Formatter().parse(source):
+            if format_spec or conversion:
+                raise ValueError(f"template field '{field}' can not have a format spec or conversion")
+            self.parts.append((literal, field))
+        if suffix:
+            self.parts.append((suffix, None))
+        self.fields = {field for literal, field in self.parts if field is not None}
+        self.source = source + suffix
+
+    def stream(self, **values:Union[str, Iterable[str]]) -> Iterator[str]:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"missing template fields: {', '.join(sorted(missing))}")
+        for literal, field in self.parts:
+            if literal:
+                yield literal
+            if field is not None:
+                value = values[field]
+                if isinstance(value, str):
+                    yield value
+                else:
+                    yield from value
+
+    def render(self, **values:Union[str, Iterable[str]]) -> str:
+        with metrics.timer('rendering'):
+            return ''.join(self.stream(**values))
+
+_builtin_templates = {} # name -> template
+_templates = {} # name -> template in use, the builtin one or the file set in config.json
+
+def register_template(name:str, source:str, suffix:str = ''):
+    """
+    Adds a builtin template. Templates set in the 'rendering' section of config.json
+    replace it if they only use its fields.
+    """
+    _builtin_templates[name] = template(source, suffix)
+    _templates.pop(name, None)
+
+_shared_settings = None
+
+def shared_settings() -> dict:
+    """
+    Returns the 'rendering' section of config.json.
+    """
+    global _shared_settings
+    if _shared_settings is None:
+        _shared_settings = configuration.config_section('rendering', default_settings)
+    return _shared_settings
+
+def get_template(name:str) -> template:
+    if name not in _templates:
+        builtin = _builtin_templates[name]
+        _templates[name] = builtin
+        path = shared_settings()['templates'].get(name)
+        if path:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    custom = template(f.read())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Warning: the '{name}' template '{path}' could not be loaded, the builtin one is used: {e}")
+            else:
+                if custom.fields <= builtin.fields:
+                    _templates[name] = custom
+                else:
+                    unknown = ', '.join(sorted(custom.fields - builtin.fields))
+                    logger.warning(f"Warning: the '{name}' template '{path}' uses unknown fields ({unknown}), the builtin one is used.")
+    return _templates[name]
+
+def template_sources() -> str:
+    """
+    Returns the source of every template in use, so outputs can be rebuilt when one changes.
+    """
+    return ''.join(name + get_template(name).source for name in sorted(_builtin_templates))
+
+def escape_script(text:str) -> str:
+    """
+    Escapes JSON embedded in a script element: '<' can neither close the element
+    ('</script>') nor open a comment ('<!--') once written as '\\u003c'.
+    """
+    return text.replace('<', '\\u003c')
+
+@contextmanager
+def atomic_file(path:str, sync:Optional[bool] = None, mode:str = 'w'):
+    """
+    Opens a temporary file next to path for writing and moves it over path when
+    the block ends, after flushing it to the disk if sync (the 'fsync' setting by
+    default) is True. Readers see either the old or the new file, never a part of
+    one, and the temporary file is removed if the block fails. mode is 'w' for
+    text, or a binary mode like 'w+b'.
+    """
+    current = shared_settings()
+    sync = current['fsync'] if sync is None else sync
+    temp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp' # writers of the same path do not share it
+    encoding = None if 'b' in mode else 'utf-8'
+    try:
+        with open(temp_path, mode, encoding=encoding, buffering=current['buffer_size']) as f:
+            yield f
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def write_atomic(path:str, content:Union[str, Iterable[str]], sync:Optional[bool] = None):
+    """
+    Writes a string or a stream of chunks to path through atomic_file.
+    """
+    with metrics.timer('io'), atomic_file(path, sync) as f:
+        if isinstance(content, str):
+            f.write(content)
+        else:
+            for chunk in content:
+                f.write(chunk)
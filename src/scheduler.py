@@ -0,0 +1,189 @@
+import heapq
+import itertools
+import logging
+import queue
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import configuration
+import metrics
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "requests_per_second": 10, # per host, 0 for no limit
+    "max_attempts": 4, # requests made for a URL before its last result is kept
+    "backoff_base": 1.0, # seconds waited after the first transient failure, doubled after each new one
+    "backoff_max": 60,
+    "max_retry_after": 120, # longest Retry-After waited for, URLs asking for more are not retried
+    "retry_statuses": [429, 500, 502, 503, 504]
+}
+
+# error classes of check_url results worth trying again
+TRANSIENT_ERRORS = ('ConnectTimeout', 'ReadTimeout', 'Timeout', 'ChunkedEncodingError')
+# causes of a ConnectionError worth trying again, others like a host name that does not resolve are final
+TRANSIENT_CONNECTION_ERRORS = ('Connection refused', 'Connection reset', 'Connection aborted', 'RemoteDisconnected', 'timed out')
+
+def transient_error(error:str) -> bool:
+    """
+    Returns whether the error of a check_url result may not happen on a new attempt.
+    """
+    if error.startswith('ConnectionError'):
+        return any(cause in error for cause in TRANSIENT_CONNECTION_ERRORS)
+    return error.startswith(TRANSIENT_ERRORS)
+
+def parse_retry_after(value:Optional[str]) -> Optional[float]:
+    """
+    Returns the seconds asked by a Retry-After header, given as seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    from email.utils import parsedate_to_datetime # rarely needed, and slow to import
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class host_state:
+    __slots__ = ('queue', 'in_flight', 'next_time')
+
+    def __init__(self):
+        self.queue = deque() # (url, attempt)
+        self.in_flight = 0
+        self.next_time = 0.0 # earliest time of the next request to the host
+
+class host_scheduler:
+    """
+    Runs check(url) for many URLs with one queue per host.
+
+    Each host gets at most per_host requests in flight and requests_per_second
+    requests per second. Results with a retryable status or a transient error are
+    queued again on their host, after the Retry-After the server asked for or an
+    exponential backoff, while the other hosts keep running.
+    """
+    def __init__(
+        self,
+        check:Callable[[str], dict],
+        host_of:Callable[[str], str],
+        max_workers:int,
+        per_host:int,
+        settings:Optional[dict] = None
+    ):
+        self.check = check
+        self.host_of = host_of
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.settings = shared_settings() if settings is None else dict(default_settings, **settings)
+        rate = self.settings['requests_per_second']
+        self.interval = 1 / rate if rate else 0.0
+
+    def retry_delay(self, result:dict, attempt:int) -> Optional[float]:
+        """
+        Returns the seconds to wait before trying a URL again, or None if result is final.
+        """
+        if attempt >= self.settings['max_attempts']:
+            return None
+        error = result.get('error') or ''
+        if result['status'] not in self.settings['retry_statuses'] and not transient_error(error):
+            return None
+        retry_after = result.get('retry_after')
+        if retry_after is not None:
+            return retry_after if retry_after <= self.settings['max_retry_after'] else None
+        delay = min(self.settings['backoff_max'], self.settings['backoff_base'] * 2 ** (attempt - 1))
+        return delay * random.uniform(0.8, 1.2) # spreads the retries of a host
+
+    def run(self, urls:list[str], on_result:Callable[[str, dict], None], cancel_event = None) -> bool:
+        """
+        Checks every URL and calls on_result(url, result) with its final result, in
+        completion order. Returns False if cancel_event was set before the end.
+        """
+        hosts = {}
+        for url in urls:
+            hosts.setdefault(self.host_of(url), host_state()).queue.append((url, 1))
+        order = itertools.count()
+        ready = [(0.0, next(order), host) for host in hosts] # (time, tie breaker, host)
+        heapq.heapify(ready)
+        finished = queue.Queue()
+        remaining = len(urls)
+        in_flight = 0
+
+        def work(host, url, attempt):
+            try:
+                finished.put((host, url, attempt, self.check(url), None))
+            except Exception as e:
+                finished.put((host, url, attempt, None, e))
+
+        def schedule(host, state):
+            if state.queue and state.in_flight < self.per_host:
+                heapq.heappush(ready, (state.next_time, next(order), host))
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls)) or 1) as executor:
+            while remaining:
+                if cancel_event is not None and cancel_event.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    return False
+
+                now = time.monotonic()
+                while ready and ready[0][0] <= now and in_flight < self.max_workers:
+                    host = heapq.heappop(ready)[2]
+                    state = hosts[host]
+                    if not state.queue or state.in_flight >= self.per_host:
+                        continue # scheduled again when one of its requests finishes
+                    if state.next_time > now: # delayed by a retry since it was scheduled
+                        schedule(host, state)
+                        continue
+                    url, attempt = state.queue.popleft()
+                    state.in_flight += 1
+                    state.next_time = max(state.next_time, now) + self.interval
+                    in_flight += 1
+                    executor.submit(work, host, url, attempt)
+                    schedule(host, state)
+
+                timeout = max(0.0, ready[0][0] - now) if ready and in_flight < self.max_workers else None
+                if cancel_event is not None:
+                    timeout = min(timeout, 0.1) if timeout is not None else 0.1
+                try:
+                    host, url, attempt, result, error = finished.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+                if error is not None:
+                    raise error
+
+                state = hosts[host]
+                state.in_flight -= 1
+                in_flight -= 1
+                delay = self.retry_delay(result, attempt)
+                if delay is None:
+                    remaining -= 1
+                    on_result(url, result)
+                else:
+                    logger.debug(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1}), last status: {result['status'] or result['error']}")
+                    metrics.count('requests.retried')
+                    state.next_time = max(state.next_time, time.monotonic() + delay)
+                    state.queue.appendleft((url, attempt + 1))
+                schedule(host, state)
+        return True
+
+_shared_settings = None
+
+def shared_settings() -> dict:
+    """
+    Returns the 'rate_limit' section of config.json.
+    """
+    global _shared_settings
+    if _shared_settings is None:
+        _shared_settings = configuration.config_section('rate_limit', default_settings)
+    return _shared_settings
+
+def set_shared_settings(settings:Optional[dict]):
+    """
+    Replaces the 'rate_limit' settings used by every scheduler. None reads them
+    from config.json again on next use.
+    """
+    global _shared_settings
+    _shared_settings = settings
@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import re
+import time
+from typing import Optional
+import folder_scan
+import rendering
+import storage
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = '.search_index.json'
+INDEX_VERSION = 3 # 3 keeps the postings, brought up to date with the folder scan cache
+
+token_pattern = re.compile(r'[a-z0-9]+')
+
+def host_suffixes(url:str) -> list[str]:
+    """
+    Returns the host of a URL and every parent domain of it ('en.wikipedia.org',
+    'wikipedia.org', 'org'), so a host query also finds its subdomains.
+    """
+    match = re.match(r'^[a-z][a-z0-9+.-]*://(?:[^/@?#]*@)?(?P<host>\[[^\]]*\]|[^/:?#]*)', url.lower())
+    if not match or not match.group('host'):
+        return []
+    parts = match.group('host').split('.')
+    return ['.'.join(parts[i:]) for i in range(len(parts))]
+
+class search_index:
+    """
+    Inverted index of the URLs of every group and single file of a tab folder and
+    of the entries of the data store.
+
+    The postings (URL and label tokens -> items, host -> items) are kept in a JSON
+    file inside the folder with the mtime and size of every indexed file and the
+    mtime the data store was read at. When the index is loaded, only the files that
+    differ from the folder scan cache (see folder_scan.py) are indexed or removed.
+    """
+    def __init__(self, folder:str, data_path:Optional[str] = None):
+        self.folder = folder
+        self.path = os.path.join(folder, INDEX_NAME)
+        self.data_path = data_path
+        self.files = {} # file name -> (mtime, size) of the indexed version
+        self.store = {'mtime': None, 'entries': {}} # data store entries, {label: url}
+        self.folder_mtime = None
+        self.items = {} # item id -> (source, name, url, label)
+        self.documents = {} # (source, name) -> item ids
+        self.tokens = {} # token -> item ids
+        self.hosts = {} # host or parent domain -> item ids
+        self.next_id = 0
+        self.matches = {} # query fragment -> tokens containing it, cleared when tokens change
+        self.changed = False
+        self.load()
+
+    def load(self):
+        content = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Warning: the search index of '{self.folder}' could not be read and will be rebuilt: {e}")
+        if content and content.get('version') == INDEX_VERSION:
+            self.files = {file_name: tuple(known) for file_name, known in content['files'].items()}
+            self.store = content['store']
+            self.items = {item_id: tuple(item) for item_id, *item in content['items']}
+            self.documents = {(source, name): ids for source, name, ids in content['documents']}
+            self.tokens = {token: set(ids) for token, ids in content['tokens'].items()}
+            self.hosts = {host: set(ids) for host, ids in content['hosts'].items()}
+            self.next_id = content['next_id']
+        # files changed since the index was saved, from the cache alone, the folder is listed on refresh
+        self.apply_scan(folder_scan.open_scan(self.folder).entries, {'indexed': 0, 'removed': 0, 'unchanged': 0})
+
+    def save(self):
+        if not self.changed or not os.path.isdir(self.folder):
+            return
+        content = {
+            'version': INDEX_VERSION,
+            'files': self.files,
+            'store': self.store,
+            'items': [[item_id, *item] for item_id, item in self.items.items()],
+            'documents': [[source, name, ids] for (source, name), ids in self.documents.items()],
+            'tokens': {token: sorted(ids) for token, ids in self.tokens.items()},
+            'hosts': {host: sorted(ids) for host, ids in self.hosts.items()},
+            'next_id': self.next_id
+        }
+        with rendering.atomic_file(self.path) as f:
+            json.dump(content, f, ensure_ascii=False)
+        self.changed = False
+
+    def item_keys(self, url:str, label:Optional[str]) -> tuple[set, list]:
+        tokens = set(token_pattern.findall(url.lower()))
+        if label:
+            tokens.update(token_pattern.findall(label.lower()))
+        return tokens, host_suffixes(url)
+
+    def add_file(self, file_name:str, entry:dict):
+        urls = entry['urls']
+        self.files[file_name] = (entry['mtime'], entry['size'])
+        self.add_document('file', file_name, list(zip(urls, entry.get('labels') or [None] * len(urls))))
+
+    def add_document(self, source:str, name:str, entries:list[tuple[str, Optional[str]]]):
+        ids = []
+        for url, label in entries:
+            item_id = self.next_id
+            self.next_id += 1
+            self.items[item_id] = (source, name, url, label)
+            tokens, hosts = self.item_keys(url, label)
+            for token in tokens:
+                self.tokens.setdefault(token, set()).add(item_id)
+            for host in hosts:
+                self.hosts.setdefault(host, set()).add(item_id)
+            ids.append(item_id)
+        self.documents[(source, name)] = ids
+        self.matches.clear()
+
+    def remove_document(self, source:str, name:str):
+        for item_id in self.documents.pop((source, name), []):
+            source, name, url, label = self.items.pop(item_id)
+            tokens, hosts = self.item_keys(url, label)
+            for token in tokens:
+                self.tokens[token].discard(item_id)
+                if not self.tokens[token]:
+                    del self.tokens[token]
+            for host in hosts:
+                self.hosts[host].discard(item_id)
+                if not self.hosts[host]:
+                    del self.hosts[host]
+        self.matches.clear()
+
+    def refresh(self, full:bool = False) -> dict:
+        """
+        Brings the index up to date with the folder and the data store. The folder is
+        only scanned again when its mtime changed, unless full is True (files edited in
+        place by other programs do not change it). Returns the counts of indexed,
+        removed and unchanged files.
+        """
+        summary = {'indexed': 0, 'removed': 0, 'unchanged': 0}
+        listed = False
+        if os.path.isdir(self.folder):
+            if full or os.stat(self.folder).st_mtime != self.folder_mtime:
+                self.refresh_files(summary)
+                listed = True
+            else:
+                summary['unchanged'] = len(self.files)
+        if self.data_path:
+            self.refresh_store()
+        self.save()
+        if listed: # read after saving, writing the index changes the folder too
+            self.folder_mtime = os.stat(self.folder).st_mtime
+        return summary
+
+    def refresh_files(self, summary:dict):
+        self.apply_scan(folder_scan.scan(self.folder), summary)
+
+    def apply_scan(self, entries:dict, summary:dict):
+        """
+        Indexes the files of entries ({file name: folder scan entry}) that are new or
+        changed and removes those that are not in it anymore.
+        """
+        for file_name, entry in entries.items():
+            known = self.files.get(file_name)
+            if known == (entry['mtime'], entry['size']):
+                summary['unchanged'] += 1
+                continue
+            if known:
+                self.remove_document('file', file_name)
+            self.add_file(file_name, entry)
+            summary['indexed'] += 1
+        for file_name in set(self.files) - set(entries):
+            del self.files[file_name]
+            self.remove_document('file', file_name)
+            summary['removed'] += 1
+        if summary['indexed'] or summary['removed']:
+            self.changed = True
+
+    def refresh_store(self):
+        store = storage.open_store(self.data_path)
+        paths = [store.path, store.path + '-wal'] # the SQLite write-ahead log changes before the database
+        mtime = max((os.stat(path).st_mtime for path in paths if os.path.exists(path)), default=None)
+        if mtime is None or mtime == self.store['mtime']:
+            return
+        self.remove_document('data', 'data')
+        self.store = {'mtime': mtime, 'entries': store.load() or {}}
+        self.add_document('data', 'data', [(url, label) for label, url in self.store['entries'].items()])
+        self.changed = True
+
+    def matching_tokens(self, fragment:str) -> list[str]:
+        if fragment not in self.matches:
+            self.matches[fragment] = [token for token in self.tokens if fragment in token]
+        return self.matches[fragment]
+
+    def find(self, query:str, host:bool = False) -> list[dict]:
+        """
+        Returns the items whose URL or label contains query, or whose host is query or
+        a subdomain of it if host is True. Each result is a dictionary with the keys
+        'source' ('file' or 'data'), 'name', 'url' and 'label'.
+        """
+        query = query.strip().lower()
+        if host:
+            candidates = self.hosts.get(query, set())
+        else:
+            candidates = None
+            # every URL containing the query contains each of its alphanumeric runs inside one of its tokens
+            for fragment in sorted(set(token_pattern.findall(query)), key=len, reverse=True):
+                ids = set()
+                for token in self.matching_tokens(fragment):
+                    ids |= self.tokens[token]
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    break
+            if candidates is None:
+                candidates = self.items.keys()
+
+        results = []
+        for item_id in sorted(candidates):
+            source, name, url, label = self.items[item_id]
+            if host or query in url.lower() or (label and query in label.lower()):
+                results.append({'source': source, 'name': name, 'url': url, 'label': label})
+        return results
+
+_indexes = {}
+
+def open_index(folder:str, data_path:Optional[str] = None) -> search_index:
+    """
+    Returns the search index of a tab folder, loading it the first time it is requested.
+    """
+    key = (os.path.abspath(folder), data_path and os.path.abspath(data_path))
+    if key not in _indexes:
+        start = time.perf_counter()
+        _indexes[key] = search_index(folder, data_path)
+        logger.debug(f"Search index of '{folder}' loaded in {time.perf_counter() - start:.3f}s")
+    return _indexes[key]
@@ -0,0 +1,177 @@
+import html
+import logging
+import os
+import re
+from os import mkdir
+from os.path import exists
+from typing import Iterator, Optional
+import configuration
+import main
+import rendering
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "threshold": 200, # groups with more URLs are written as a launcher page and parts, 0 never shards
+    "shard_size": 50, # URLs per part
+    "open_delay": 250 # milliseconds between two tabs opened by a part
+}
+
+PART_NAME = re.compile(r'part (?P<n>[0-9]+)\.html')
+
+shard_html_template_a = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Auto Tab Opener</title>
+    <script type="application/json" id="tab-saver-data">{data}</script>
+</head>
+<body>
+    <div style="font-family: sans-serif; text-align: center; margin-top: 50px; color: #555;">
+        <p id="status">Opening tabs...</p>
+        <p>If tabs are not opening, please check your browser's pop-up blocker settings and refresh the page.</p>
+    </div>
+"""
+
+shard_html_template_b = """
+    <script>
+        // The tabs of this part are opened one by one, so the browser is never asked for all of them at once
+        const data = JSON.parse(document.getElementById('tab-saver-data').textContent);
+        const status = document.getElementById('status');
+        data.urls.forEach((url, i) => {
+            setTimeout(() => {
+                window.open(url, '_blank');
+                status.textContent = `Part ${data.part} of ${data.parts}: ${i + 1}/${data.urls.length} tabs opened`;
+            }, i * data.delay);
+        });
+    </script>
+</body>
+</html>"""
+
+launcher_html_template_a = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>{title}</title>
+    <script type="application/json" id="tab-saver-data">{data}</script>
+</head>
+<body style="font-family: sans-serif; margin: 50px; color: #333;">
+    <h1>{title}</h1>
+    <p id="summary"></p>
+    <button id="next">Open the next part</button>
+    <ol id="parts"></ol>
+"""
+
+launcher_html_template_b = """
+    <script>
+        // Each part opens its own tabs, the launcher only keeps track of the next one to open
+        const data = JSON.parse(document.getElementById('tab-saver-data').textContent);
+        const storageKey = 'tab-saver-next:' + location.pathname;
+        const list = document.getElementById('parts');
+        const next = document.getElementById('next');
+        let current = Number(localStorage.getItem(storageKey) || 0);
+        // group names can hold '#' or '?', every segment of a part path is escaped
+        const partHref = shard => shard.split('/').map(encodeURIComponent).join('/');
+
+        document.getElementById('summary').textContent = `${data.count} tabs in ${data.shards.length} parts`;
+        data.shards.forEach((shard, i) => {
+            const item = document.createElement('li');
+            const link = document.createElement('a');
+            link.href = partHref(shard);
+            link.target = '_blank';
+            link.textContent = `Part ${i + 1}`;
+            link.addEventListener('click', () => localStorage.setItem(storageKey, i + 1));
+            item.appendChild(link);
+            list.appendChild(item);
+        });
+
+        function update() {
+            next.disabled = current >= data.shards.length;
+            next.textContent = next.disabled ? 'Every part was opened' : `Open part ${current + 1}`;
+        }
+        next.addEventListener('click', () => {
+            window.open(partHref(data.shards[current]), '_blank');
+            current += 1;
+            localStorage.setItem(storageKey, current);
+            update();
+        });
+        update();
+    </script>
+</body>
+</html>"""
+
+rendering.register_template('shard', shard_html_template_a, shard_html_template_b)
+rendering.register_template('launcher', launcher_html_template_a, launcher_html_template_b)
+
+def shard_settings() -> dict:
+    return configuration.config_section('sharding', default_settings)
+
+def should_shard(url_count:int, settings:Optional[dict] = None) -> bool:
+    settings = shard_settings() if settings is None else settings
+    return bool(settings['threshold']) and url_count > settings['threshold']
+
+def parts_folder_name(file_name:str) -> str:
+    """
+    Returns the name of the folder holding the parts of a group file, next to it.
+    """
+    return file_name + ' parts'
+
+def iter_shards(urls:list[str], shard_size:int) -> Iterator[list[str]]:
+    for start in range(0, len(urls), shard_size):
+        yield urls[start:start + shard_size]
+
+def render_shard(urls:list[str], part:int, parts:int, open_delay:int) -> str:
+    return rendering.get_template('shard').render(data=main.iter_data_block(urls, part=part, parts=parts, delay=open_delay))
+
+def render_launcher(title:str, shard_paths:list[str], count:int) -> str:
+    return rendering.get_template('launcher').render(
+        title=html.escape(title), data=main.iter_data_block([], shards=shard_paths, count=count)
+    )
+
+def remove_stale_parts(folder:str, parts:int):
+    """
+    Deletes the parts left by a previous, larger version of the group.
+    """
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            match = PART_NAME.fullmatch(entry.name)
+            if match and int(match.group('n')) > parts:
+                os.remove(entry.path)
+
+def remove_parts(path:str):
+    """
+    Deletes the parts of a group that is now written as a single file.
+    """
+    destination, file_name = path.rsplit('/', 1)
+    folder = destination + '/' + parts_folder_name(file_name[:-len('.html')] if file_name.endswith('.html') else file_name)
+    if exists(folder):
+        remove_stale_parts(folder, 0)
+        if not os.listdir(folder):
+            os.rmdir(folder)
+
+def write_sharded_group(path:str, urls:list[str], settings:Optional[dict] = None, save_manifest:bool = True):
+    """
+    Writes a group as a launcher page at path and parts of shard_size URLs in a
+    folder next to it. Parts are rendered and written one at a time, so no file
+    grows with the size of the group. The launcher is recorded in the folder
+    manifest with the URLs of every part.
+    """
+    settings = shard_settings() if settings is None else settings
+    destination, file_name = path.rsplit('/', 1)
+    stem = file_name[:-len('.html')] if file_name.endswith('.html') else file_name
+    folder_name = parts_folder_name(stem)
+    folder = destination + '/' + folder_name
+    if not exists(folder):
+        mkdir(folder)
+
+    shard_size = max(1, settings['shard_size'])
+    parts = -(-len(urls) // shard_size)
+    shard_paths = []
+    for part, shard in enumerate(iter_shards(urls, shard_size), 1):
+        part_name = f'part {part}.html'
+        rendering.write_atomic(folder + '/' + part_name, render_shard(shard, part, parts, settings['open_delay']))
+        shard_paths.append(folder_name + '/' + part_name)
+    remove_stale_parts(folder, parts)
+
+    main.write_generated_file(path, render_launcher(stem, shard_paths, len(urls)), urls, save_manifest)
+    logger.debug(f'{len(urls)} URLs written in {parts} parts to \"{folder}\"')
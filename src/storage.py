@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import threading
+from os.path import exists
+from typing import Iterator, Optional
+import configuration
+import metrics
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "backend": "json", # "json" keeps the whole collection in the data file, "sqlite" uses a database
+    "sqlite_path": None, # defaults to the data file path with a .db extension
+    "page_size": 1000
+}
+
+class json_store:
+    """
+    Keeps the {label: url} collection in a single JSON file, the original format of
+    the project. Every commit rewrites the whole file, atomically.
+    """
+    def __init__(self, path:str, page_size:int = default_settings['page_size']):
+        self.path = path
+        self.page_size = page_size
+        self.data = None
+        self.stamp = None # (mtime, size) of the data file when self.data was read or written
+        self.changed = False
+
+    def file_stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> Optional[dict]:
+        """
+        loads and returns a dictionary from a JSON file if possible, else return False.
+        """
+        if not exists(self.path):
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({}, f, indent=4)
+            logger.info(f"New file created at '{self.path}'")
+            self.data = {}
+            self.stamp = self.file_stamp()
+            return {}
+
+        # we try to read the file
+        try:
+            stamp = self.file_stamp()
+            with metrics.timer('io'), open(self.path, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+                if not content:
+                    self.data = {}
+                    self.stamp = stamp
+                    return {}
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while reading '{self.path}': {e}")
+            return False
+
+        # we process the data into a dictionary.
+        data = json.loads(content)
+        if not isinstance(data, dict):
+            logger.warning(f"Warning: '{self.path}' must be a dictionary, try changing the file path.")
+        else:
+            self.data = data
+            self.stamp = stamp
+            return dict(data)
+
+    def loaded(self) -> dict:
+        """
+        Returns the collection, read again if the data file was replaced by another
+        process or command since it was last read, unless it has uncommitted changes.
+        """
+        if self.data is None or (not self.changed and self.file_stamp() != self.stamp):
+            self.data = self.load() or {}
+        return self.data
+
+    def get(self, label:str) -> Optional[str]:
+        return self.loaded().get(label)
+
+    def labels_of(self, url:str) -> list[str]:
+        return [label for label, value in self.loaded().items() if value == url]
+
+    def count(self) -> int:
+        return len(self.loaded())
+
+    def iter_pages(self, page_size:Optional[int] = None) -> Iterator[list[tuple[str, str]]]:
+        items = list(self.loaded().items())
+        page_size = page_size or self.page_size
+        for start in range(0, len(items), page_size):
+            yield items[start:start + page_size]
+
+    def upsert_many(self, entries:dict):
+        self.loaded().update(entries)
+        self.changed = True
+
+    def delete_many(self, labels):
+        data = self.loaded()
+        for label in labels:
+            data.pop(label, None)
+        self.changed = True
+
+    def replace_all(self, entries:dict):
+        self.data = dict(entries)
+        self.changed = True
+
+    def commit(self):
+        """
+        Writes the collection to a temporary file and renames it over the data file,
+        so a crash during the write never leaves a corrupted file.
+        """
+        if not self.changed:
+            return
+        import tempfile # deferred, it is only needed to commit
+        with metrics.timer('io'):
+            # a unique name, the CLI and the generator may commit the same file at the same time
+            fd, temp_path = tempfile.mkstemp(
+                prefix=os.path.basename(self.path) + '.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.path))
+            )
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self.data, f, indent=4)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        self.stamp = self.file_stamp()
+        self.changed = False
+
+    def close(self):
+        self.commit()
+
+class sqlite_store:
+    """
+    Keeps the {label: url} collection in a SQLite database with indexed labels and
+    URLs. Changes are written as transactional batches, so the cost of a commit
+    depends on the size of the change and not on the size of the collection.
+    """
+    def __init__(self, path:str, page_size:int = default_settings['page_size']):
+        self.path = path
+        self.page_size = page_size
+        import sqlite3 # only loaded by the sqlite backend
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS urls (id INTEGER PRIMARY KEY, label TEXT NOT NULL UNIQUE, url TEXT NOT NULL)'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS urls_url ON urls (url)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def load(self) -> dict:
+        with metrics.timer('io'), self.lock:
+            return dict(self.connection.execute('SELECT label, url FROM urls ORDER BY id'))
+
+    def get(self, label:str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute('SELECT url FROM urls WHERE label = ?', (label,)).fetchone()
+        return row[0] if row else None
+
+    def labels_of(self, url:str) -> list[str]:
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT label FROM urls WHERE url = ? ORDER BY id', (url,))]
+
+    def count(self) -> int:
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+
+    def iter_pages(self, page_size:Optional[int] = None) -> Iterator[list[tuple[str, str]]]:
+        """
+        Yields the collection in insertion order, page_size entries at a time.
+        """
+        page_size = page_size or self.page_size
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    'SELECT id, label, url FROM urls WHERE id > ? ORDER BY id LIMIT ?', (last_id, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [(label, url) for row_id, label, url in rows]
+
+    def upsert_many(self, entries:dict):
+        with metrics.timer('io'), self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT INTO urls (label, url) VALUES (?, ?) ON CONFLICT(label) DO UPDATE SET url = excluded.url',
+                entries.items()
+            )
+
+    def delete_many(self, labels):
+        with metrics.timer('io'), self.lock, self.connection:
+            self.connection.executemany('DELETE FROM urls WHERE label = ?', ((label,) for label in labels))
+
+    def replace_all(self, entries:dict):
+        with metrics.timer('io'), self.lock, self.connection:
+            self.connection.execute('DELETE FROM urls')
+            self.connection.executemany('INSERT INTO urls (label, url) VALUES (?, ?)', entries.items())
+
+    def commit(self):
+        pass # every change is committed in its own transaction
+
+    def get_meta(self, key:str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key:str, value:str):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def migrate_json(self, json_path:str, page_size:Optional[int] = None):
+        """
+        Copies a JSON data file into the database the first time the database is used.
+        The JSON file is left untouched.
+        """
+        if self.get_meta('migrated_from') is not None or not exists(json_path):
+            return
+        data = json_store(json_path).load() or {}
+        items = list(data.items())
+        page_size = page_size or self.page_size
+        for start in range(0, len(items), page_size):
+            self.upsert_many(dict(items[start:start + page_size]))
+        self.set_meta('migrated_from', os.path.abspath(json_path))
+        logger.info(f"{len(items)} entries migrated from '{json_path}' to '{self.path}'")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def apply_changes(store, save_point:dict, data:dict):
+    """
+    Writes to the store only the entries of data that differ from save_point.
+    """
+    changed = {label: url for label, url in data.items() if save_point.get(label) != url}
+    removed = [label for label in save_point if label not in data]
+    if changed:
+        store.upsert_many(changed)
+    if removed:
+        store.delete_many(removed)
+    store.commit()
+    return len(changed), len(removed)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def sqlite_path_of(data_path:str, settings:dict) -> str:
+    return settings.get('sqlite_path') or os.path.splitext(data_path)[0] + '.db'
+
+def data_files(data_path:str = 'URLs.json', settings:Optional[dict] = None) -> list[str]:
+    """
+    Returns the files the configured backend writes changes of the data to: the
+    JSON file, or the SQLite database and its write-ahead log.
+    """
+    settings = configuration.config_section('storage', default_settings) if settings is None else settings
+    if settings['backend'] == 'sqlite':
+        sqlite_path = sqlite_path_of(data_path, settings)
+        return [sqlite_path, sqlite_path + '-wal']
+    return [data_path]
+
+def open_store(data_path:str = 'URLs.json', settings:Optional[dict] = None):
+    """
+    Returns the store of a data file, using the backend chosen in the 'storage'
+    section of config.json. With the sqlite backend an existing JSON data file
+    is migrated into the database automatically.
+    """
+    settings = configuration.config_section('storage', default_settings) if settings is None else settings
+    key = (os.path.abspath(data_path), settings['backend'])
+    with _stores_lock:
+        if key in _stores:
+            return _stores[key]
+        if settings['backend'] == 'sqlite':
+            store = sqlite_store(sqlite_path_of(data_path, settings), settings['page_size'])
+            store.migrate_json(data_path)
+        else:
+            store = json_store(data_path, settings['page_size'])
+        _stores[key] = store
+        return store
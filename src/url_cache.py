@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import configuration
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "enabled": True,
+    "path": "URL cache.json",
+    "positive_ttl": 86400, # seconds a working URL is trusted without checking it again
+    "negative_ttl": 3600, # seconds a failing URL is considered failing without checking it again
+    "max_entries": 100000
+}
+
+class validation_cache:
+    """
+    Persistent cache of URL validation results.
+
+    Each entry stores the status code, final URL, time of the check and error class
+    of a URL. Entries expire after positive_ttl or negative_ttl seconds depending on
+    the result, and the least recently used entries are evicted past max_entries.
+    """
+    def __init__(
+        self,
+        path:str = default_settings['path'],
+        positive_ttl:float = default_settings['positive_ttl'],
+        negative_ttl:float = default_settings['negative_ttl'],
+        max_entries:int = default_settings['max_entries'],
+        enabled:bool = True
+    ):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.changed = False
+        self.lock = threading.Lock()
+        if enabled:
+            self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Warning: the validation cache at '{self.path}' could not be read and will be rebuilt: {e}")
+            return
+        # the file is saved from least to most recently used
+        self.entries = OrderedDict(content.get('entries', {}))
+
+    def save(self):
+        """
+        Writes the cache to disk if it changed since it was loaded or last saved.
+        The file is replaced atomically so an interrupted save keeps the old cache.
+        """
+        if not self.enabled or not self.changed:
+            return
+        import tempfile # deferred, it is only needed to save
+        with self.lock:
+            content = {'entries': self.entries}
+            # a unique name, other processes may be saving the same cache
+            fd, temp_path = tempfile.mkstemp(
+                prefix=os.path.basename(self.path) + '.', suffix='.tmp', dir=os.path.dirname(self.path) or '.'
+            )
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(content, f)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            self.changed = False
+
+    def expired(self, entry:dict, now:Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        ttl = self.positive_ttl if entry.get('valid') else self.negative_ttl
+        return now - entry['checked'] > ttl
+
+    def get(self, url:str, refresh:bool = False) -> Optional[dict]:
+        """
+        Returns the cached result for url, or None if it is missing, expired or
+        refresh is True.
+        """
+        if not self.enabled or refresh:
+            return None
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            if self.expired(entry):
+                del self.entries[url]
+                self.changed = True
+                return None
+            self.entries.move_to_end(url)
+            return entry
+
+    def put(self, result:dict):
+        """
+        Stores a result dictionary made by validation.check_url.
+        """
+        if not self.enabled:
+            return
+        error = result.get('error')
+        entry = {
+            'valid': result['valid'],
+            'status': result['status'],
+            'final_url': result.get('final_url'),
+            'checked': time.time(),
+            'error': error.split(':', 1)[0] if error else None
+        }
+        with self.lock:
+            self.entries[result['url']] = entry
+            self.entries.move_to_end(result['url'])
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.changed = True
+
+    def forget(self, url:Optional[str] = None):
+        """
+        Removes url from the cache, or every entry if no url is given.
+        """
+        with self.lock:
+            if url is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(url, None)
+            self.changed = True
+
+_shared_cache = None
+
+def shared_cache() -> validation_cache:
+    """
+    Returns the cache configured in the 'validation_cache' section of config.json,
+    loading it on first use.
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        settings = configuration.config_section('validation_cache', default_settings)
+        _shared_cache = validation_cache(
+            path=settings['path'],
+            positive_ttl=settings['positive_ttl'],
+            negative_ttl=settings['negative_ttl'],
+            max_entries=settings['max_entries'],
+            enabled=settings['enabled']
+        )
+    return _shared_cache
+
+def set_shared_cache(cache:Optional[validation_cache]):
+    """
+    Replaces the shared cache, like the benchmark does with a temporary one. None
+    loads the configured cache again on next use.
+    """
+    global _shared_cache
+    _shared_cache = cache
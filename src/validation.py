@@ -0,0 +1,133 @@
+import threading
+import time
+from urllib.parse import urlsplit
+from typing import Callable, Optional
+import url_cache
+import http_client
+import metrics
+
+MAX_WORKERS = 16 # global limit of URLs being checked at the same time
+PER_HOST_LIMIT = 4 # limit of URLs being checked at the same time on a single host
+TIMEOUT = 5
+
+class validation_cancelled(Exception):
+    """
+    Raised by validate_urls when its cancel event is set.
+    """
+
+def url_host(url:str) -> str:
+    """
+    Returns the lowercase host of a URL, or an empty string if it has none.
+    """
+    try:
+        return (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        return ''
+
+def check_url(url:str, timeout:float = TIMEOUT) -> dict:
+    """
+    Requests the URL through the shared HTTP client and returns a result dictionary with the keys
+    'url', 'valid', 'status', 'final_url', 'latency' (in seconds), 'error', 'cached' and
+    'retry_after' (seconds asked by the server before trying again, if any).
+    A URL answering 429 is throttled but alive, so it counts as valid.
+    """
+    import requests # deferred, see http_client
+    import scheduler
+    result = {
+        'url': url, 'valid': False, 'status': None, 'final_url': None,
+        'latency': None, 'error': None, 'cached': False, 'retry_after': None
+    }
+    start = time.perf_counter()
+    try:
+        response = http_client.request_url(url, timeout=timeout) # Add a timeout to prevent hanging
+        result['status'] = response.status_code
+        result['final_url'] = response.url
+        result['valid'] = 200 <= response.status_code < 300 or response.status_code == 429
+        result['retry_after'] = scheduler.parse_retry_after(response.headers.get('Retry-After'))
+    except requests.exceptions.RequestException as e:
+        # This catches various errors like ConnectionError, Timeout, TooManyRedirects, etc.
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['latency'] = time.perf_counter() - start
+    return result
+
+def cached_result(url:str, entry:dict) -> dict:
+    """
+    Builds a result dictionary like the ones of check_url from a cache entry.
+    """
+    return {
+        'url': url, 'valid': entry['valid'], 'status': entry['status'],
+        'final_url': entry['final_url'], 'latency': 0.0, 'error': entry['error'],
+        'cached': True, 'retry_after': None
+    }
+
+def validate_urls(
+    url_list:list[str],
+    max_workers:int = MAX_WORKERS,
+    per_host:int = PER_HOST_LIMIT,
+    timeout:float = TIMEOUT,
+    refresh:bool = False,
+    cache:Optional[url_cache.validation_cache] = None,
+    on_progress:Optional[Callable[[int, int], None]] = None,
+    cancel_event:Optional[threading.Event] = None
+) -> list[dict]:
+    """
+    Checks a list of URLs concurrently and returns one result dictionary per URL
+    (see check_url) in the same order as url_list.
+
+    URLs with a fresh entry in the validation cache are not requested again unless
+    refresh is True. At most max_workers requests are in flight at once and at most
+    per_host of them go to the same host, at the rate set in the 'rate_limit' section
+    of config.json. Throttled and transient failures are retried (see scheduler.host_scheduler).
+
+    on_progress(done, total) is called as URLs are checked, and setting cancel_event
+    stops the run with validation_cancelled (results checked so far stay cached).
+    """
+    url_list = list(url_list)
+    if not url_list:
+        return []
+    with metrics.timer('validation'):
+        return run_validation(url_list, max_workers, per_host, timeout, refresh, cache, on_progress, cancel_event)
+
+def run_validation(
+    url_list:list[str], max_workers:int, per_host:int, timeout:float, refresh:bool, cache,
+    on_progress = None, cancel_event = None
+) -> list[dict]:
+    """
+    Body of validate_urls, kept apart so the whole run is timed as the validation stage.
+    """
+    cache = url_cache.shared_cache() if cache is None else cache
+
+    results = [None] * len(url_list)
+    pending = {} # url -> indexes in url_list, so repeated URLs are checked once
+    for i, url in enumerate(url_list):
+        entry = cache.get(url, refresh=refresh)
+        if entry is not None:
+            results[i] = cached_result(url, entry)
+        else:
+            pending.setdefault(url, []).append(i)
+    checked = len(url_list) - sum(len(indexes) for indexes in pending.values())
+    metrics.count('cache.hits', checked)
+    metrics.count('cache.misses', len(pending))
+    if on_progress:
+        on_progress(checked, len(url_list))
+    if not pending:
+        return results
+
+    def on_result(url, result):
+        nonlocal checked
+        checked += len(pending[url])
+        if on_progress:
+            on_progress(checked, len(url_list))
+        metrics.observe_latency(url_host(url), result['latency'])
+        metrics.count('requests.errors' if result['error'] else 'requests.done')
+        cache.put(result)
+        for i in pending[url]:
+            results[i] = result
+
+    import scheduler # loads the thread pool machinery only when URLs are requested
+    runner = scheduler.host_scheduler(lambda url: check_url(url, timeout), url_host, max_workers, per_host)
+    completed = runner.run(list(pending), on_result, cancel_event)
+    cache.save()
+    if not completed:
+        raise validation_cancelled(f'validation cancelled after {checked} of {len(url_list)} URLs')
+    return results
@@ -0,0 +1,189 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Optional
+import configuration
+import storage
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "debounce": 0.3, # seconds without changes before a burst of edits is handled
+    "poll_interval": 1.0, # seconds between two checks of the file when inotify is not available
+    "inotify": True # set to false to always poll
+}
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+class polling_watcher:
+    """
+    Detects changes of files by comparing their mtime and size at a fixed interval.
+    """
+    def __init__(self, paths:list[str], poll_interval:float = default_settings['poll_interval']):
+        self.paths = paths
+        self.poll_interval = poll_interval
+        self.last = self.signature()
+
+    def signature(self):
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return signature
+
+    def wait(self, timeout:Optional[float] = None) -> bool:
+        """
+        Returns True as soon as a file changed, or False after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.signature()
+            if current != self.last:
+                self.last = current
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            remaining = self.poll_interval if deadline is None else min(self.poll_interval, deadline - time.monotonic())
+            time.sleep(max(0.0, remaining))
+
+    def close(self):
+        pass
+
+class inotify_watcher:
+    """
+    Detects changes of files through Linux inotify. The folders of the files are
+    watched, so editors that save by writing a new file and renaming it over the
+    old one are seen too.
+    """
+    def __init__(self, paths:list[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.names = {} # watch descriptor -> names of the watched files in its folder
+        folders = {}
+        for path in paths:
+            folders.setdefault(os.path.dirname(os.path.abspath(path)), set()).add(os.path.basename(path).encode())
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        for folder, names in folders.items():
+            wd = libc.inotify_add_watch(self.fd, folder.encode(), mask)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, 'inotify_add_watch failed')
+            self.names[wd] = names
+
+    def wait(self, timeout:Optional[float] = None) -> bool:
+        """
+        Returns True as soon as a file changed, or False after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                return False
+            if self.read_events():
+                return True
+
+    def read_events(self) -> bool:
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        changed = False
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name in self.names.get(wd, ()):
+                changed = True
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def open_watcher(paths:list[str], settings:Optional[dict] = None):
+    """
+    Returns an inotify watcher on Linux, or a polling watcher when inotify can not be used.
+    """
+    settings = configuration.config_section('watch', default_settings) if settings is None else settings
+    if settings['inotify'] and sys.platform.startswith('linux'):
+        try:
+            return inotify_watcher(paths)
+        except (OSError, AttributeError) as e:
+            logger.warning(f'Warning: inotify is not available ({e}), polling the files instead.')
+    return polling_watcher(paths, settings['poll_interval'])
+
+def read_data(path:str) -> Optional[dict]:
+    """
+    Reads the data through the store configured in config.json (see storage.open_store),
+    returning None while it can not be read. A JSON data file that is missing,
+    empty or only partially written is never taken for the new data, since
+    editors empty it before they write it.
+    """
+    store = storage.open_store(path)
+    if isinstance(store, storage.json_store):
+        try:
+            with open(store.path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            data = json.loads(content) if content.strip() else None
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+    import sqlite3 # already loaded by the sqlite store
+    try:
+        return store.load() # transactions are never seen halfway
+    except sqlite3.Error as e:
+        logger.warning(f"Warning: '{store.path}' could not be read: {e}")
+        return None
+
+def diff(old:dict, new:dict) -> dict:
+    """
+    Returns the labels added, changed (to another URL) and removed between two versions of the data.
+    """
+    return {
+        'added': [label for label in new if label not in old],
+        'changed': [label for label, url in new.items() if label in old and old[label] != url],
+        'removed': [label for label in old if label not in new]
+    }
+
+def watch(path:str, on_change:Callable[[], None], settings:Optional[dict] = None):
+    """
+    Calls on_change every time the data of path changes, once per burst of edits:
+    after a change, on_change waits until the files of the configured store (see
+    storage.data_files) stay unchanged for the debounce delay. Runs until interrupted.
+    """
+    settings = configuration.config_section('watch', default_settings) if settings is None else settings
+    paths = storage.data_files(path)
+    watcher = open_watcher(paths, settings)
+    logger.info(f"Watching '{paths[0]}' with {type(watcher).__name__.split('_')[0]}, press Ctrl+C to stop.")
+    try:
+        while True:
+            watcher.wait()
+            while watcher.wait(settings['debounce']):
+                pass
+            on_change()
+    except KeyboardInterrupt:
+        logger.info('Stopped watching.')
+    finally:
+        watcher.close()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')) # shared modules live in src
+import main
+import manifest
+
+def test_regenerate_deleted_file(tmp_path):
+    """
+    A generated file deleted from its folder is written again under the same name.
+    """
+    destination = str(tmp_path / 'Test directory')
+    url = 'https://en.wikipedia.org/wiki/Lorem_ipsum'
+    path = main.get_valid_path(destination, 'Regenerated', url_list=[url])
+    main.write_generated_file(path, main.render_single(url), [url])
+    os.remove(path)
+    assert main.get_valid_path(destination, 'Regenerated', url_list=[url]) == path
+    main.write_generated_file(path, main.render_single(url), [url])
+    assert main.get_valid_path(destination, 'Regenerated', url_list=[url]) is None # same URLs, nothing to write
+
+def test_reservations_are_not_saved(tmp_path):
+    """
+    A reserved name is taken in the running process but is not written to the manifest.
+    """
+    index = manifest.folder_manifest(str(tmp_path))
+    index.reserve('Reserved.html', manifest.url_set_hash(['https://example.com/']))
+    index.save()
+    assert index.contains('Reserved.html')
+    assert not manifest.folder_manifest(str(tmp_path)).contains('Reserved.html')